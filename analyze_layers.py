@@ -3,101 +3,277 @@
 Script to correct layer names in ppa_cadtopdf.json based on ppa_layers.json
 """
 
-import json
+import argparse
+import os
+import pickle
 import re
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
 
-# Load both files
-with open("ppa_layers.json", "r") as f:
-    ppa_layers = json.load(f)
+import orjson
 
-with open("/home/pkurane/projects/layerslist/ppa_cadtopdf.json", "r") as f:
-    cadtopdf = json.load(f)
+# Numeric suffix such as "_12" in a concrete layer name
+_NUM_RE = re.compile(r"_\d+")
+# cadtopdf wildcards only ever appear as "_*", so mapping "*" alone to "n"
+# turns "_*" into "_n" in a single C-level pass
+_WILDCARD_TABLE = str.maketrans({"*": "n"})
+# A digit run that can be made possessive: no literal digit or other run follows
+_POSSESSIVE_RUN_RE = re.compile(r"\\d\+(?![0-9]|\\d)")
 
-# Extract valid layer name patterns from ppa_layers.json
-valid_patterns = set()
-for layer in ppa_layers:
-    layer_name = layer.get("Layer Name", "")
-    if layer_name:
-        valid_patterns.add(layer_name)
+# Below this many names a process pool costs more to start than it saves
+_PARALLEL_THRESHOLD = 20000
+# Names sent to a worker per task, to amortize the IPC round trip
+_POOL_CHUNKSIZE = 256
 
-print("Valid patterns from ppa_layers.json:")
-for pattern in sorted(valid_patterns):
-    print(f"  {pattern}")
+PPA_LAYERS_PATH = "ppa_layers.json"
+CADTOPDF_PATH = "/home/pkurane/projects/layerslist/ppa_cadtopdf.json"
+# Pickled extraction results, reused while the source JSON is unchanged
+CACHE_DIR = ".analyze_layers_cache"
+
+# Populated by set_valid_patterns(); empty until main() (or a caller) loads them
+valid_patterns = frozenset()
+compiled_patterns = []
+fused_pattern = None
+fused_group_patterns = {}
+
+
+def load_json(path):
+    """Load a JSON file (orjson parses straight from bytes)"""
+    with open(path, "rb") as f:
+        return orjson.loads(f.read())
+
+
+def load_cached(path, extract):
+    """
+    Return extract(load_json(path)), reusing a pickled result from CACHE_DIR
+    while the file's mtime and size are unchanged.
+    """
+    st = os.stat(path)
+    key = (os.path.abspath(path), st.st_mtime_ns, st.st_size)
+    cache_path = os.path.join(
+        CACHE_DIR, f"{extract.__name__}-{os.path.basename(path)}.pickle"
+    )
+
+    try:
+        with open(cache_path, "rb") as f:
+            cached_key, value = pickle.load(f)
+        if cached_key == key:
+            return value
+    except (OSError, EOFError, TypeError, ValueError, pickle.UnpicklingError):
+        # Missing or unreadable cache: fall back to parsing the JSON
+        pass
+
+    value = extract(load_json(path))
+    try:
+        os.makedirs(CACHE_DIR, exist_ok=True)
+        with open(cache_path, "wb") as f:
+            pickle.dump((key, value), f, protocol=5)
+    except OSError:
+        pass
+    return value
+
+
+def extract_valid_patterns(ppa_layers):
+    """Extract valid layer name patterns from ppa_layers.json"""
+    return frozenset(
+        sys.intern(layer["Layer Name"])
+        for layer in ppa_layers
+        if layer.get("Layer Name")
+    )
+
+
+def pattern_to_regex(pattern):
+    """
+    Convert a ppa_layers.json pattern to a regex string (_n / n_ match digits).
+    Digit runs are possessive, so a failed match never backtracks into them,
+    except where a possessive run would swallow a literal digit that follows it
+    (as in app.py's parse_layer_pattern).
+    """
+    regex = pattern.replace("_n", r"_\d+").replace("n_", r"\d+_")
+    return _POSSESSIVE_RUN_RE.sub(r"\\d++", regex)
+
+
+def set_valid_patterns(patterns):
+    """
+    Install the patterns used by find_matching_pattern and compile them once.
+    Also serves as the process pool initializer.
+    """
+    global valid_patterns, compiled_patterns, fused_pattern, fused_group_patterns
+
+    valid_patterns = frozenset(patterns)
+
+    # Compile each valid pattern once instead of once per (layer, pattern) pair
+    compiled_patterns = []
+    for pattern in sorted(valid_patterns):
+        try:
+            compiled_patterns.append((pattern, re.compile(pattern_to_regex(pattern))))
+        except re.error as e:
+            # Reported once here, so matching itself never needs a try/except
+            print(
+                f"Warning: dropping invalid pattern {pattern!r}: {e}", file=sys.stderr
+            )
+
+    # Fuse the patterns into one alternation so a single fullmatch call replaces
+    # the per-pattern loop; the named group that matched identifies the pattern.
+    fused_pattern = re.compile(
+        "|".join(
+            f"(?P<g{i}>{regex.pattern})"
+            for i, (_, regex) in enumerate(compiled_patterns)
+        )
+    )
+    fused_group_patterns = {
+        f"g{i}": pattern for i, (pattern, _) in enumerate(compiled_patterns)
+    }
+
+    # Cached answers belong to the previous pattern set
+    find_matching_pattern.cache_clear()
 
 
 # Function to convert any layer name to a normalized pattern
+@lru_cache(maxsize=None)
 def normalize_to_pattern(layer_name):
     """
     Convert a layer name to a normalized pattern by replacing:
     - Actual numbers (_1, _2, etc.) with _n
     - Wildcards (_*) with _n
     """
-    result = layer_name
-    # Replace _* with _n (wildcard from cadtopdf)
-    result = result.replace("_*", "_n")
-    # Replace _\d+ with _n (actual numbers)
-    result = re.sub(r"_\d+", "_n", result)
-    return result
+    # Both rewrites are anchored on "_", so there is nothing to do without one
+    if "_" not in layer_name:
+        return layer_name
+    # Replace _* with _n (wildcard from cadtopdf), then _\d+ with _n (actual numbers)
+    return _NUM_RE.sub("_n", layer_name.translate(_WILDCARD_TABLE))
 
 
 # Function to check if normalized name matches a valid pattern
+@lru_cache(maxsize=None)
 def find_matching_pattern(layer_name):
     """Find the best matching pattern for a layer name"""
+    # Exact pattern names need neither normalization nor regex
+    if layer_name in valid_patterns:
+        return layer_name
+
     normalized = normalize_to_pattern(layer_name)
 
     # First try exact match with normalized name
     if normalized in valid_patterns:
         return normalized
 
-    # Then try to match by converting pattern to regex and matching
-    for pattern in valid_patterns:
-        # Convert pattern to regex
-        # _n should match _\d+
-        regex_pattern = pattern.replace("_n", r"_\d+")
-        # n at end should match \d+
-        regex_pattern = regex_pattern.replace("n_", r"\d+_")
-        regex_pattern = f"^{regex_pattern}$"
+    # Digit placeholders only ever follow or precede "_", so names
+    # without one cannot match any pattern regex
+    if "_" not in layer_name:
+        return None
 
-        try:
-            if re.match(regex_pattern, layer_name):
-                return pattern
-        except:
-            pass
+    # Then try the fused pattern regex
+    match = fused_pattern.fullmatch(layer_name)
+    if match:
+        return fused_group_patterns[match.lastgroup]
 
     return None
 
 
-# Analyze all layer names in cadtopdf
-print("\n\nAnalyzing ppa_cadtopdf.json layers:")
-print("=" * 80)
-
-all_layer_names = []
-for sheet in cadtopdf.get("DxfToPdfLayerConfigCat_CD_ALL", []):
-    for config in sheet.get("planPdfLayerConfigs", []):
-        layer_name = config.get("layerName", "")
-        if layer_name and layer_name not in all_layer_names:
-            all_layer_names.append(layer_name)
-
-# Categorize layers
-matched_layers = []
-unmatched_layers = []
-layer_mappings = {}  # Maps old name to new (corrected) name
-
-for layer_name in sorted(all_layer_names):
-    matched_pattern = find_matching_pattern(layer_name)
-    if matched_pattern:
-        matched_layers.append((layer_name, matched_pattern))
-        layer_mappings[layer_name] = matched_pattern
-        print(f"✓ MATCH: {layer_name:50s} -> {matched_pattern}")
-    else:
-        unmatched_layers.append(layer_name)
-        print(f"✗ UNMATCHED: {layer_name}")
-
-print(f"\n\nSummary:")
-print(f"  Total unique layers: {len(all_layer_names)}")
-print(f"  Matched: {len(matched_layers)}")
-print(f"  Unmatched: {len(unmatched_layers)}")
-
-print("\n\nUnmatched layers that will be REMOVED:")
-for layer in unmatched_layers:
-    print(f"  - {layer}")
+def iter_layer_names(cad_config):
+    """Yield every non-empty layerName from a CAD-to-PDF layer config"""
+    for sheet in cad_config.get("DxfToPdfLayerConfigCat_CD_ALL", ()):
+        for config in sheet.get("planPdfLayerConfigs", ()):
+            layer_name = config.get("layerName")
+            if layer_name:
+                # Names repeat across sheets; share one string object per name
+                yield sys.intern(layer_name)
+
+
+def extract_layer_names(cad_config):
+    """Return the set of unique layer names in a CAD-to-PDF layer config"""
+    return frozenset(iter_layer_names(cad_config))
+
+
+def _match(layer_name):
+    """Process pool entry point; patterns arrive through set_valid_patterns"""
+    return find_matching_pattern(layer_name)
+
+
+def match_layers(layer_names):
+    """Return {layer_name: matched_pattern or None} in sorted name order"""
+    names = sorted(layer_names)
+    if len(names) < _PARALLEL_THRESHOLD:
+        return dict(zip(names, map(find_matching_pattern, names)))
+
+    # Each lookup is independent, so large inputs fan out across processes
+    with ProcessPoolExecutor(
+        initializer=set_valid_patterns, initargs=(valid_patterns,)
+    ) as executor:
+        return dict(zip(names, executor.map(_match, names, chunksize=_POOL_CHUNKSIZE)))
+
+
+def write_jsonl(layer_matches, stream):
+    """Write one {"layer": ..., "match": ...} JSON object per line"""
+    stream.write(
+        b"".join(
+            orjson.dumps(
+                {"layer": layer_name, "match": matched_pattern},
+                option=orjson.OPT_APPEND_NEWLINE,
+            )
+            for layer_name, matched_pattern in layer_matches.items()
+        )
+    )
+
+
+def main(argv=None):
+    """Load both files and print the layer mapping report"""
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument(
+        "--jsonl",
+        action="store_true",
+        help="emit one JSON object per layer instead of the human-readable report",
+    )
+    args = parser.parse_args(argv)
+
+    set_valid_patterns(load_cached(PPA_LAYERS_PATH, extract_valid_patterns))
+    all_layer_names = load_cached(CADTOPDF_PATH, extract_layer_names)
+
+    if args.jsonl:
+        # Machine-readable output for downstream stages; unmatched layers
+        # carry "match": null
+        write_jsonl(match_layers(all_layer_names), sys.stdout.buffer)
+        return
+
+    print("Valid patterns from ppa_layers.json:")
+    for pattern in sorted(valid_patterns):
+        print(f"  {pattern}")
+
+    # Analyze all layer names in cadtopdf
+    print("\n\nAnalyzing ppa_cadtopdf.json layers:")
+    print("=" * 80)
+
+    # Categorize layers
+    layer_matches = match_layers(all_layer_names)
+    # Maps old name to new (corrected) name
+    layer_mappings = {
+        name: pattern for name, pattern in layer_matches.items() if pattern
+    }
+    unmatched_layers = [
+        name for name, pattern in layer_matches.items() if pattern is None
+    ]
+
+    # Build the report lines first and write them in one call
+    report_lines = [
+        (
+            f"✓ MATCH: {layer_name:50s} -> {matched_pattern}\n"
+            if matched_pattern
+            else f"✗ UNMATCHED: {layer_name}\n"
+        )
+        for layer_name, matched_pattern in layer_matches.items()
+    ]
+    sys.stdout.write("".join(report_lines))
+
+    print(f"\n\nSummary:")
+    print(f"  Total unique layers: {len(all_layer_names)}")
+    print(f"  Matched: {len(layer_mappings)}")
+    print(f"  Unmatched: {len(unmatched_layers)}")
+
+    print("\n\nUnmatched layers that will be REMOVED:")
+    sys.stdout.write("".join(f"  - {layer}\n" for layer in unmatched_layers))
+
+
+if __name__ == "__main__":
+    main()
@@ -7,21 +7,49 @@ Supports .dxf and .zip uploads with comprehensive validation.
 """
 
 import os
+import base64
 import json
 import zipfile
-import io
+import heapq
 import re
-import shutil
-from flask import Flask, render_template, request, flash, redirect, url_for, send_file
+import sqlite3
+import tempfile
+import threading
+import time
+import weakref
+import zlib
+from collections import OrderedDict
+from contextlib import suppress
+from functools import lru_cache
+from operator import itemgetter
+from types import SimpleNamespace
+from flask import (
+    Flask,
+    render_template,
+    request,
+    flash,
+    get_flashed_messages,
+    make_response,
+    redirect,
+    session,
+    url_for,
+)
 from werkzeug.utils import secure_filename
 import ezdxf
+import numpy as np
+import orjson
+from ezdxf import bbox as ezdxf_bbox
 from ezdxf import colors
-from ezdxf.math import area, Vec3
+from ezdxf.math import Vec3
 from ezdxf.addons.drawing.frontend import Frontend
 from ezdxf.addons.drawing.properties import RenderContext
 from ezdxf.addons.drawing.svg import SVGBackend
 from ezdxf.addons.drawing.properties import Properties, LayoutProperties
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import event, insert, text
+from sqlalchemy import inspect as sqlalchemy_inspect
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import load_only
 from flask_login import (
     LoginManager,
     UserMixin,
@@ -34,6 +62,11 @@ from werkzeug.security import generate_password_hash, check_password_hash
 import hashlib
 from comparison_engine import DXFComparator, ChangeType, generate_diff_svg, LayerChange
 
+# ezdxf silently falls back to pure Python when its compiled extensions are
+# missing (e.g. no wheel for this Python); parsing and geometry are much slower then
+if not ezdxf.options.use_c_ext:
+    print("WARNING: ezdxf C extensions are not in use; DXF processing will be slow")
+
 app = Flask(__name__)
 app.secret_key = os.environ.get("SECRET_KEY", "dev-secret-key-change-in-production")
 
@@ -50,9 +83,35 @@ app.config["SQLALCHEMY_DATABASE_URI"] = os.environ.get(
 )
 app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
 
+# Werkzeug password hash method, e.g. "scrypt" (default) or "pbkdf2:sha256:260000"
+# for cheaper logins; existing hashes are upgraded on the next successful login
+app.config["PASSWORD_HASH_METHOD"] = os.environ.get("PASSWORD_HASH_METHOD", "scrypt")
+
 # Initialize database
 db = SQLAlchemy(app)
 
+# SQLite connection tuning: WAL lets readers run alongside the upload writes and
+# synchronous=NORMAL is durable under WAL without an fsync per commit
+SQLITE_PRAGMAS = (
+    "journal_mode=WAL",
+    "synchronous=NORMAL",
+    "temp_store=MEMORY",
+    "cache_size=-65536",  # 64 MB page cache
+    "mmap_size=268435456",  # 256 MB
+)
+
+
+@event.listens_for(Engine, "connect")
+def set_sqlite_pragmas(dbapi_connection, connection_record):
+    """Apply SQLITE_PRAGMAS to each new SQLite connection (other backends untouched)"""
+    if not isinstance(dbapi_connection, sqlite3.Connection):
+        return
+    cursor = dbapi_connection.cursor()
+    for pragma in SQLITE_PRAGMAS:
+        cursor.execute(f"PRAGMA {pragma}")
+    cursor.close()
+
+
 # Initialize Flask-Login
 login_manager = LoginManager()
 login_manager.init_app(app)
@@ -79,12 +138,20 @@ class User(UserMixin, db.Model):
 
     def set_password(self, password):
         """Hash and set user password"""
-        self.password_hash = generate_password_hash(password)
+        self.password_hash = generate_password_hash(
+            password, method=app.config["PASSWORD_HASH_METHOD"]
+        )
 
     def check_password(self, password):
         """Verify user password"""
         return check_password_hash(self.password_hash, password)
 
+    def password_needs_rehash(self):
+        """True if the stored hash uses a method other than the configured one"""
+        method = app.config["PASSWORD_HASH_METHOD"]
+        stored = self.password_hash.split("$", 1)[0]
+        return stored != method and not stored.startswith(method + ":")
+
     def __repr__(self):
         return f"<User {self.username}>"
 
@@ -100,6 +167,11 @@ class Version(db.Model):
     """Stores metadata about uploaded DXF versions"""
 
     __tablename__ = "versions"
+    __table_args__ = (
+        db.Index("ix_versions_user_hash", "user_id", "file_hash"),
+        # Version listings filter by user and sort newest first
+        db.Index("ix_versions_user_upload_date", "user_id", "upload_date"),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey("users.id"), nullable=False)
@@ -110,6 +182,12 @@ class Version(db.Model):
     file_size = db.Column(db.Integer)
     dxf_version = db.Column(db.String(10))
     total_layers = db.Column(db.Integer)
+    # Drawing-wide aggregates of the layer snapshots, filled at upload time
+    total_area = db.Column(db.Float)
+    min_x = db.Column(db.Float)
+    min_y = db.Column(db.Float)
+    max_x = db.Column(db.Float)
+    max_y = db.Column(db.Float)
     project_name = db.Column(db.String(255))
     notes = db.Column(db.Text)
 
@@ -121,6 +199,9 @@ class LayerSnapshot(db.Model):
     """Stores extracted metrics for each layer at a point in time"""
 
     __tablename__ = "layer_snapshots"
+    __table_args__ = (
+        db.Index("ix_layer_snapshots_version_layer", "version_id", "layer_name"),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     version_id = db.Column(db.Integer, db.ForeignKey("versions.id"), nullable=False)
@@ -145,6 +226,9 @@ class ComparisonResult(db.Model):
     """Stores results of version comparisons"""
 
     __tablename__ = "comparison_results"
+    __table_args__ = (
+        db.Index("ix_comparison_results_base_new", "base_version_id", "new_version_id"),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     base_version_id = db.Column(
@@ -156,6 +240,8 @@ class ComparisonResult(db.Model):
     removed_layers_count = db.Column(db.Integer, default=0)
     modified_layers_count = db.Column(db.Integer, default=0)
     unchanged_layers_count = db.Column(db.Integer, default=0)
+    # Base64 of zlib-compressed JSON, kept as text so existing columns need no
+    # type migration; rows written before compression hold plain JSON
     changes_json = db.Column(db.Text)
 
     def __repr__(self):
@@ -201,14 +287,27 @@ IGNORED_LAYERS = {
     "RM TXT",
 }
 
+# DXF layer names are case-insensitive, so ignored layers are matched upper-cased
+_IGNORED_UPPER = frozenset(name.upper() for name in IGNORED_LAYERS)
+
+
+def is_ignored_layer(layer_name):
+    """Check a layer name against IGNORED_LAYERS, ignoring case"""
+    return layer_name.upper() in _IGNORED_UPPER
+
+
 # Allowed DXF entity types for each JSON rule type
 ENTITY_TYPE_MAPPING = {
-    "Polygon": {"LWPOLYLINE", "POLYLINE", "HATCH", "MPOLYGON"},
-    "Line": {"LINE", "LWPOLYLINE", "POLYLINE"},
-    "Text": {"TEXT", "MTEXT"},
-    "Dimension": {"DIMENSION", "ARC_DIMENSION", "LEADER", "MLEADER"},
+    "Polygon": frozenset({"LWPOLYLINE", "POLYLINE", "HATCH", "MPOLYGON"}),
+    "Line": frozenset({"LINE", "LWPOLYLINE", "POLYLINE"}),
+    "Text": frozenset({"TEXT", "MTEXT"}),
+    "Dimension": frozenset({"DIMENSION", "ARC_DIMENSION", "LEADER", "MLEADER"}),
 }
 
+# Most error markers drawn on the validation preview; broken files can have
+# thousands of bad entities, and past this point the preview is unreadable
+MAX_MARKERS = 500
+
 # Ensure upload folder exists
 os.makedirs(app.config["UPLOAD_FOLDER"], exist_ok=True)
 
@@ -218,60 +317,250 @@ def allowed_file(filename):
     return "." in filename and filename.rsplit(".", 1)[1].lower() in ALLOWED_EXTENSIONS
 
 
+# 'n' placeholder tokens in JSON layer names and their regex replacements.
+# A bare "n" is only a placeholder at the end of a name ("..._n") or right after
+# one of the known prefixes; it is never replaced inside words like 'Green'.
+_N_PLACEHOLDER_PREFIXES = (
+    "STAIR_",
+    "RAMP_",
+    "LIFT_",
+    "UNIT_",
+    "FLIGHT_",
+    "LANDING_",
+    "ROOM_",
+    "FACADE_",
+    "AREA_",
+    "CTI_",
+    "OHEL_",
+)
+# Digit runs are possessive: a failed match never backtracks into them, which
+# matters when one fused regex tries every rule against a layer name
+_TOKEN_MAP = {
+    "BLK_n": r"BLK_-?\d++",
+    "_n_": r"_-?\d++_",
+    "=n": r"=-?\d++",
+    "n": r"-?\d++",
+}
+_TOKEN_RE = re.compile(
+    "|".join(
+        [r"BLK_n", r"_n_", r"=n", r"(?<=_)n\Z"]
+        + [f"(?<={re.escape(prefix)})n" for prefix in _N_PLACEHOLDER_PREFIXES]
+    )
+)
+
+
+# Built-up area layers, whose colors define the allowed occupancy colors
+_BLT_UP_RE = re.compile(r"^BLK_-?\d+_FLR_-?\d+_BLT_UP_AREA$")
+
+
+def _replace_token(match):
+    regex = _TOKEN_MAP[match.group(0)]
+    # A possessive run would swallow a literal digit that follows it
+    if match.string[match.end() : match.end() + 1].isdigit():
+        return regex.replace("++", "+")
+    return regex
+
+
+@lru_cache(maxsize=None)
 def parse_layer_pattern(pattern_name):
     """Convert JSON layer name pattern to regex, replacing 'n' placeholders with digit matchers"""
-    # Replace 'n' placeholders with regex digit patterns
-    escaped = re.escape(pattern_name)
-    # Replace 'n' with '\d+' (one or more digits)
-    # Replace 'n' placeholders in specific contexts (e.g., BLK_n, _n_, =n)
-    # Avoids replacing 'n' in words like 'Green' or 'Open'
-    regex_pattern = pattern_name
-    regex_pattern = regex_pattern.replace("BLK_n", r"BLK_-?\d+")
-    regex_pattern = regex_pattern.replace("_n_", r"_-?\d+_")
-    if regex_pattern.endswith("_n"):
-        regex_pattern = regex_pattern[:-2] + r"_-?\d+"
-    regex_pattern = regex_pattern.replace("=n", r"=-?\d+")
-
-    # Special case: "STAIR_n" at end or middle
-    regex_pattern = regex_pattern.replace("STAIR_n", r"STAIR_-?\d+")
-    regex_pattern = regex_pattern.replace("RAMP_n", r"RAMP_-?\d+")
-    regex_pattern = regex_pattern.replace("LIFT_n", r"LIFT_-?\d+")
-    regex_pattern = regex_pattern.replace("UNIT_n", r"UNIT_-?\d+")
-    regex_pattern = regex_pattern.replace("FLIGHT_n", r"FLIGHT_-?\d+")
-    regex_pattern = regex_pattern.replace("LANDING_n", r"LANDING_-?\d+")
-    regex_pattern = regex_pattern.replace("ROOM_n", r"ROOM_-?\d+")
-    regex_pattern = regex_pattern.replace("FACADE_n", r"FACADE_-?\d+")
-    regex_pattern = regex_pattern.replace("AREA_n", r"AREA_-?\d+")
-    regex_pattern = regex_pattern.replace("CTI_n", r"CTI_-?\d+")
-    regex_pattern = regex_pattern.replace("OHEL_n", r"OHEL_-?\d+")
+    # One left-to-right pass over the name replaces every placeholder token
+    regex_pattern, replaced = _TOKEN_RE.subn(_replace_token, pattern_name)
 
     # If no placeholders were found, use strict pattern matching
-    if regex_pattern == pattern_name:
+    if not replaced:
         return f"^{re.escape(pattern_name)}$"
 
     return f"^{regex_pattern}$"
 
 
+@lru_cache(maxsize=None)
+def compile_layer_pattern(pattern_name):
+    """Compiled regex for a JSON layer name pattern, built once per pattern"""
+    return re.compile(parse_layer_pattern(pattern_name))
+
+
+def _literal_prefix(regex):
+    """Literal text that every match of a ^-anchored pattern regex starts with"""
+    prefix = []
+    i = 1 if regex.startswith("^") else 0
+    while i < len(regex):
+        char = regex[i]
+        if char == "\\":
+            escaped = regex[i + 1 : i + 2]
+            # \d, \w, ... are classes, not literals
+            if not escaped or escaped.isalnum():
+                break
+            literal, step = escaped, 2
+        elif char in ".^$*+?{}[]()|":
+            break
+        else:
+            literal, step = char, 1
+        # A quantified character is optional or repeated, so the prefix ends
+        if regex[i + step : i + step + 1] in ("?", "*", "+", "{"):
+            break
+        prefix.append(literal)
+        i += step
+    return "".join(prefix)
+
+
+@lru_cache(maxsize=8)
+def get_layer_rule_matcher(layer_patterns):
+    """
+    Build a matcher for a tuple of rule "Layer Name" patterns. The returned
+    function maps a layer name to the sorted indices of every matching rule.
+
+    Distinct patterns are fused into one alternation, so a single match() finds
+    the first one that fits; matching resumes from the next pattern only when a
+    name fits more than one. Rules sharing a pattern are matched together, and
+    patterns are gated on their literal prefix before any regex runs.
+    """
+    distinct = list(dict.fromkeys(layer_patterns))
+    position = {pattern: i for i, pattern in enumerate(distinct)}
+    rule_indices = [[] for _ in distinct]
+    for rule_index, pattern in enumerate(layer_patterns):
+        rule_indices[position[pattern]].append(rule_index)
+
+    # Every match of a pattern begins with its literal prefix. When that prefix
+    # contains "_", only names whose first "_"-separated segment equals the
+    # prefix's can match, so those patterns are bucketed by that segment and a
+    # name is only tried against its own bucket plus the ungated patterns.
+    buckets = {}
+    ungated = []
+    for i, pattern in enumerate(distinct):
+        literal = _literal_prefix(parse_layer_pattern(pattern))
+        head, sep, _ = literal.partition("_")
+        if sep:
+            buckets.setdefault(head, []).append(i)
+        else:
+            ungated.append(i)
+
+    # Bucket head (None for names outside every bucket) -> (candidate pattern
+    # indices, fused regex per start offset, compiled the first time it is needed)
+    candidates_by_head = {}
+
+    def candidates_for(head):
+        if head not in buckets:
+            head = None
+        entry = candidates_by_head.get(head)
+        if entry is None:
+            candidates = sorted(buckets.get(head, []) + ungated)
+            entry = candidates_by_head[head] = (candidates, [None] * len(candidates))
+        return entry
+
+    def fused_from(candidates, fused, start):
+        # Alternation over candidates[start:]; group pK is candidates[K]
+        regex = fused[start]
+        if regex is None:
+            regex = fused[start] = re.compile(
+                "|".join(
+                    f"(?P<p{k}>{parse_layer_pattern(distinct[candidates[k]])})"
+                    for k in range(start, len(candidates))
+                )
+            )
+        return regex
+
+    def match_rules(name):
+        candidates, fused = candidates_for(name.partition("_")[0])
+        matched = []
+        start = 0
+        while start < len(candidates):
+            match = fused_from(candidates, fused, start).match(name)
+            if match is None:
+                break
+            k = int(match.lastgroup[1:])
+            matched.extend(rule_indices[candidates[k]])
+            start = k + 1
+        if len(matched) > 1:
+            matched.sort()
+        return matched
+
+    return match_rules
+
+
+@lru_cache(maxsize=8)
+def _compile_rules(rule_keys):
+    """Matcher and mandatory rule indices for (layer name, requirement) pairs"""
+    match_rules = get_layer_rule_matcher(tuple(name for name, _ in rule_keys))
+    mandatory_rule_indices = tuple(
+        i
+        for i, (_, requirement) in enumerate(rule_keys)
+        if requirement.lower().startswith("mandatory")
+    )
+    return match_rules, mandatory_rule_indices
+
+
+def compile_rules(master_rules):
+    """
+    Return (match_rules, mandatory_rule_indices) for a rule list. Both are built
+    once per distinct rule set and reused across uploads; per request only the
+    key of layer names and requirements is assembled.
+    """
+    return _compile_rules(
+        tuple(
+            (rule["Layer Name"], rule.get("Requirement", "")) for rule in master_rules
+        )
+    )
+
+
+def polygon_area(xy):
+    """Shoelace area of a closed polygon given as an (n, 2) float64 array"""
+    if len(xy) < 3:
+        return 0.0
+    x = xy[:, 0]
+    y = xy[:, 1]
+    return 0.5 * abs(float(np.dot(x, np.roll(y, -1)) - np.dot(y, np.roll(x, -1))))
+
+
+def polygon_area_py(points):
+    """Shoelace area of a closed polygon given as a list of (x, y) floats"""
+    if len(points) < 3:
+        return 0.0
+    total = 0.0
+    prev_x, prev_y = points[-1]
+    for x, y in points:
+        total += prev_x * y - x * prev_y
+        prev_x, prev_y = x, y
+    return 0.5 * abs(total)
+
+
+def polygon_areas(xys):
+    """
+    Shoelace areas of many closed polygons, each an (n, 2) float64 array,
+    computed in one vectorized pass over their concatenated vertices.
+    """
+    areas = np.zeros(len(xys))
+    counts = np.fromiter(map(len, xys), dtype=np.intp, count=len(xys))
+    # Fewer than three vertices enclose no area (and would leave empty segments)
+    keep = np.flatnonzero(counts >= 3)
+    if not len(keep):
+        return areas
+    counts = counts[keep]
+    xy = np.concatenate([xys[i] for i in keep])
+    starts = np.cumsum(counts) - counts
+    # Each vertex pairs with the next one in its own polygon, wrapping at the end
+    following = np.arange(1, len(xy) + 1)
+    following[starts + counts - 1] = starts
+    cross = xy[:, 0] * xy[following, 1] - xy[:, 1] * xy[following, 0]
+    areas[keep] = 0.5 * np.abs(np.add.reduceat(cross, starts))
+    return areas
+
+
 def calculate_entity_area(entity):
     """Calculate area of a closed entity (LWPOLYLINE, POLYLINE, HATCH, MPOLYGON)"""
     try:
         dxftype = entity.dxftype()
         if dxftype == "LWPOLYLINE":
             if entity.is_closed:
-                # Use ezdxf's internal area calculation if available (newer versions)
-                # or manually calculate polygon area
-                with entity.points("xy") as points:
-                    if len(points) < 3:
-                        return 0.0
-                    # shoelace formula for polygon area
-                    return abs(area(points))
+                # ezdxf keeps LWPOLYLINE vertices in an (n, 5) float64 array
+                # (x, y, start width, end width, bulge); view x/y without copying
+                return polygon_area(entity.lwpoints.values[:, :2])
         elif dxftype == "POLYLINE":
             if entity.is_closed:
-                # 2D Polyline only
-                points = [v.dxf.location[:2] for v in entity.vertices]
-                if len(points) < 3:
-                    return 0.0
-                return abs(area(points))
+                # 2D Polyline only. Vertices are separate entities, so the points
+                # are Python floats already; a scalar loop beats building an array.
+                points = [(v.dxf.location.x, v.dxf.location.y) for v in entity.vertices]
+                return polygon_area_py(points)
         elif dxftype == "HATCH":
             # Hatch area is complex, simplified for single boundary
             return entity.area if hasattr(entity, "area") else 0.0
@@ -280,34 +569,200 @@ def calculate_entity_area(entity):
     return 0.0
 
 
-def validate_text_content(text_str, layer_name):
-    """Validate text content based on layer name suffixes"""
-    clean_text = text_str.strip().upper()
+# Expected text formats for numeric text layers
+_CAPACITY_RE = re.compile(r"^(\d+)\s*L?$")
+_VOLTAGE_RE = re.compile(r"^(\d+(\.\d+)?)\s*(KV)?$")
+_NUMERIC_RE = re.compile(r"^(\d+(\.\d+)?)\s*[A-Z%]*$")
 
+
+@lru_cache(maxsize=None)
+def _text_rule_kind(layer_name):
+    """Which text format a layer's name calls for (None if any text is fine)"""
     # Rule 1: Capacity (CAPACITY_L=n) -> Expect Integer
     if "CAPACITY_L" in layer_name:
+        return "capacity"
+    # Rule 2: Voltage (VOLTAGE_KV=n) -> Expect Number
+    if "VOLTAGE_KV" in layer_name:
+        return "voltage"
+    # Rule 3: Height/Width/Slope (General number check)
+    if any(x in layer_name for x in ["_HEIGHT", "_WIDTH", "_SLOPE"]):
+        return "numeric"
+    return None
+
+
+@lru_cache(maxsize=8192)
+def _check_text_format(kind, clean_text):
+    """Validate cleaned text for a rule kind; labels repeat, so results are cached"""
+    if kind == "capacity":
         # Allow "1000", "1000L", "1000 L"
-        match = re.match(r"^(\d+)\s*L?$", clean_text)
-        if not match:
+        if not _CAPACITY_RE.match(clean_text):
             return False, "Expected numeric capacity (e.g. '5000' or '5000L')"
-
-    # Rule 2: Voltage (VOLTAGE_KV=n) -> Expect Number
-    elif "VOLTAGE_KV" in layer_name:
+    elif kind == "voltage":
         # Allow "11", "11KV", "11 KV", "11.5"
-        match = re.match(r"^(\d+(\.\d+)?)\s*(KV)?$", clean_text)
-        if not match:
+        if not _VOLTAGE_RE.match(clean_text):
             return False, "Expected numeric voltage (e.g. '11' or '11KV')"
-
-    # Rule 3: Height/Width/Slope (General number check)
-    elif any(x in layer_name for x in ["_HEIGHT", "_WIDTH", "_SLOPE"]):
+    elif kind == "numeric":
         # Simple number check
-        match = re.match(r"^(\d+(\.\d+)?)\s*[A-Z%]*$", clean_text)
-        if not match:
+        if not _NUMERIC_RE.match(clean_text):
             return False, "Expected numeric value"
 
     return True, None
 
 
+def validate_text_content(text_str, layer_name):
+    """Validate text content based on layer name suffixes"""
+    kind = _text_rule_kind(layer_name)
+    if kind is None:
+        return True, None
+    return _check_text_format(kind, text_str.strip().upper())
+
+
+# Color codes whose allowed colors come from the BLT_UP_AREA layers
+_OCCUPANCY_COLOR_CODES = frozenset(
+    {"As per Sub-Occupancy", "As per sub-occupancy type"}
+)
+# Color codes that accept any color
+_ANY_COLOR_CODES = frozenset({"Any", "NA", "N/A", "ANY"})
+# First number in each comma-separated part of an ACI color code ("1, 2 (M)")
+_COLOR_CODE_NUM_RE = re.compile(r"\d+")
+
+
+@lru_cache(maxsize=None)
+def _parse_color_spec(color_code):
+    """
+    Parse a rule's "Color Code" once into a tagged tuple:
+    ("occupancy", None), ("any", None), ("rgb", true color int or None)
+    or ("aci", frozenset of ACI numbers).
+    """
+    if color_code in _OCCUPANCY_COLOR_CODES:
+        return ("occupancy", None)
+    if color_code.startswith("RGB"):
+        try:
+            parts = [int(x.strip()) for x in color_code.replace("RGB", "").split(",")]
+        except ValueError:
+            return ("rgb", None)
+        if len(parts) != 3:
+            return ("rgb", None)
+        return ("rgb", colors.rgb2int((parts[0], parts[1], parts[2])))
+    if color_code in _ANY_COLOR_CODES:
+        return ("any", None)
+    # Handle complex color codes like "1, 2, 3", "1 (M)"
+    codes = set()
+    for part in color_code.split(","):
+        match = _COLOR_CODE_NUM_RE.search(part)
+        if match:
+            codes.add(int(match.group(0)))
+    return ("aci", frozenset(codes))
+
+
+@lru_cache(maxsize=None)
+def _fix_color_target(color_code):
+    """
+    Color a fix script should set for a rule's color code: "T r,g,b" for RGB
+    codes, else the first ACI number listed. None if the code names no specific
+    color (occupancy, any, or no number at all).
+    """
+    if color_code in _OCCUPANCY_COLOR_CODES or color_code in _ANY_COLOR_CODES:
+        return None
+    if color_code.startswith("RGB"):
+        return f"T {color_code.replace('RGB', '').strip()}"
+    match = _COLOR_CODE_NUM_RE.search(color_code.split(",")[0])
+    return match.group(0) if match else None
+
+
+def _color_matches(color_spec, color, true_color, occupancy_colors):
+    """Whether an ACI color / true color (None if unset) satisfies a parsed spec"""
+    kind, value = color_spec
+    if kind == "occupancy":
+        return color in occupancy_colors or (
+            true_color is not None and true_color in occupancy_colors
+        )
+    if kind == "rgb":
+        return value is not None and true_color == value
+    if kind == "any":
+        return True
+    return color in value
+
+
+def _entity_color_matches(entity, color_specs, occupancy_colors):
+    """Whether an entity's own color satisfies any of the parsed color specs"""
+    dxf = entity.dxf
+    color = dxf.color
+    # ByLayer (256) inherits the invalid layer color; ByBlock (0) is not acceptable
+    if color == 256 or color == 0:
+        return False
+    # An unset true color reads as None
+    true_color = dxf.true_color
+    return any(
+        _color_matches(spec, color, true_color, occupancy_colors)
+        for spec in color_specs
+    )
+
+
+# Entity types with an is_closed flag
+_CLOSABLE_TYPES = ("LWPOLYLINE", "POLYLINE")
+# Entity types whose content is checked by validate_text_content
+_TEXT_TYPES = ("TEXT", "MTEXT")
+
+
+def is_polygon_closed(entity, dxftype):
+    """Whether a LWPOLYLINE / POLYLINE / HATCH encloses an area"""
+    if dxftype in _CLOSABLE_TYPES and entity.is_closed:
+        return True
+    if dxftype == "HATCH":
+        # Hatches are generally closed areas
+        return True
+    # Check start/end points manually; only the end vertices are compared,
+    # so no per-vertex Python objects are built
+    try:
+        if dxftype == "LWPOLYLINE":
+            # (n, 5) float64 array of x, y, start width, end width, bulge
+            values = entity.lwpoints.values
+            return len(values) > 2 and bool((values[0] == values[-1]).all())
+        if dxftype == "POLYLINE":
+            vertices = entity.vertices
+            return (
+                len(vertices) > 2
+                and vertices[0].dxf.location == vertices[-1].dxf.location
+            )
+    except Exception:
+        pass
+    return False
+
+
+def check_layer_polygons(entities_by_type):
+    """
+    Closure and area for a layer's polygon entities, given its entities
+    grouped by DXF type. Returns [(entity, is_closed, area)]; open polygons
+    have area 0. Closed LWPOLYLINE areas are computed in one batch.
+    """
+    polygon_checks = []
+    batched = []  # (index in polygon_checks, xy) of flagged-closed LWPOLYLINEs
+    for dxftype in ("LWPOLYLINE", "POLYLINE", "HATCH"):
+        for e in entities_by_type.get(dxftype, ()):
+            is_closed = is_polygon_closed(e, dxftype)
+            area = 0.0
+            if is_closed:
+                if dxftype == "LWPOLYLINE" and e.is_closed:
+                    batched.append((len(polygon_checks), e.lwpoints.values[:, :2]))
+                else:
+                    area = calculate_entity_area(e)
+            polygon_checks.append((e, is_closed, area))
+
+    if batched:
+        areas = polygon_areas([xy for _, xy in batched])
+        for (i, _), area in zip(batched, areas.tolist()):
+            e, is_closed, _ = polygon_checks[i]
+            polygon_checks[i] = (e, is_closed, area)
+    return polygon_checks
+
+
+# Entity types get_entity_center can place; every other type gets (0, 0)
+_CENTER_TYPES = frozenset(
+    {"LWPOLYLINE", "POLYLINE", "LINE", "TEXT", "MTEXT", "INSERT", "CIRCLE", "ARC"}
+)
+
+
 def get_entity_center(entity):
     """Get a representative center point for an entity for error marking"""
     try:
@@ -329,13 +784,40 @@ def get_entity_center(entity):
                 return entity.dxf.insert
             elif entity.dxf.hasattr("center"):
                 return entity.dxf.center
-    except:
+    except Exception:
         pass
     return (0, 0)  # Fallback
 
 
+def load_json(path):
+    """Load a JSON file (orjson parses straight from bytes)"""
+    with open(path, "rb") as f:
+        return orjson.loads(f.read())
+
+
+@lru_cache(maxsize=8)
+def _load_rules(path, mtime_ns):
+    """Parse a rules file; mtime_ns is part of the key so edits force a reload"""
+    return load_json(path)
+
+
+def load_rules(path):
+    """
+    Load a rules JSON file, reusing the parsed list until the file changes on
+    disk (e.g. when the admin page replaces the master file). The result is
+    shared between requests and must not be mutated.
+    """
+    return _load_rules(path, os.stat(path).st_mtime_ns)
+
+
 def load_allowed_layers(config_path=None):
-    """Load allowed layer names from the PDF layer configuration file."""
+    """
+    Load allowed layer names from the PDF layer configuration file.
+
+    Returns (exact_names, layer_pattern): a frozenset of upper-cased exact
+    layer names and one compiled regex fusing every wildcard pattern (None if
+    the config has no wildcards).
+    """
     # If no config_path provided, try default locations
     if config_path is None:
         # Try multiple possible locations for the config file
@@ -352,15 +834,21 @@ def load_allowed_layers(config_path=None):
                 config_path = path
                 break
 
-    allowed_layers = set()
+    exact_layers = set()
+    patterns = set()
 
     if not config_path or not os.path.exists(config_path):
         print(f"DEBUG: Config file not found: {config_path}")
-        return allowed_layers
+        return frozenset(), None
+
+    # Reuse the parsed config until the file changes on disk
+    mtime_ns = os.stat(config_path).st_mtime_ns
+    cached = ALLOWED_LAYERS_CACHE.get(config_path)
+    if cached is not None and cached[0] == mtime_ns:
+        return cached[1]
 
     try:
-        with open(config_path, "r") as f:
-            config = json.load(f)
+        config = load_json(config_path)
 
         # Extract layer names from all sheet configurations
         configs = config.get("DxfToPdfLayerConfigCat_CD_ALL", [])
@@ -372,128 +860,145 @@ def load_allowed_layers(config_path=None):
                     if "*" in layer_name:
                         # Convert pattern to regex for matching
                         # BLK_*_FLR_*_FLOOR_PLAN -> BLK_\d+_FLR_\d+_FLOOR_PLAN
-                        # Escape other regex special chars
-                        pattern = layer_name
-                        # First escape special regex chars except *
-                        for char in [
-                            ".",
-                            "+",
-                            "?",
-                            "^",
-                            "$",
-                            "(",
-                            ")",
-                            "[",
-                            "]",
-                            "{",
-                            "}",
-                            "|",
-                            "\\",
-                        ]:
-                            pattern = pattern.replace(char, "\\" + char)
-                        # Then replace * with digit pattern
-                        pattern = pattern.replace("*", r"\d+")
-                        allowed_layers.add(("pattern", pattern))
+                        # Escape regex special chars, then turn the escaped * into
+                        # a digit pattern
+                        patterns.add(re.escape(layer_name).replace(r"\*", r"\d+"))
                     else:
-                        allowed_layers.add(("exact", layer_name.upper()))
+                        exact_layers.add(layer_name.upper())
 
-        print(f"DEBUG: Loaded {len(allowed_layers)} allowed layers from {config_path}")
+        print(
+            f"DEBUG: Loaded {len(exact_layers)} exact names and {len(patterns)} "
+            f"patterns from {config_path}"
+        )
         # Print first few for debugging
-        sample = list(allowed_layers)[:10]
-        for item in sample:
-            print(f"DEBUG: {item}")
+        for item in sorted(patterns)[:10]:
+            print(f"DEBUG: pattern {item}")
     except Exception as e:
         print(f"DEBUG: Error loading config: {e}")
         import traceback
 
         traceback.print_exc()
+        # Partial result; not cached so the next call retries the file
+        return frozenset(exact_layers), _fuse_layer_patterns(patterns)
 
+    allowed_layers = (frozenset(exact_layers), _fuse_layer_patterns(patterns))
+    ALLOWED_LAYERS_CACHE[config_path] = (mtime_ns, allowed_layers)
     return allowed_layers
 
 
-# Global cache for allowed layers - initialize as None to force load on first use
-ALLOWED_LAYERS_CACHE = None
+def _fuse_layer_patterns(patterns):
+    """Fuse wildcard layer regexes into one anchored alternation (None if empty)"""
+    valid = []
+    for pattern in sorted(patterns):
+        try:
+            re.compile(pattern)
+        except re.error:
+            print(f"DEBUG: Skipping invalid layer pattern {pattern}")
+            continue
+        valid.append(f"(?:{pattern})")
+
+    if not valid:
+        return None
+    return re.compile("^(?:" + "|".join(valid) + ")$")
+
+
+# Global cache for allowed layers: config path -> (mtime_ns, allowed layers)
+ALLOWED_LAYERS_CACHE = {}
 
 
 # Force cache reload on module reload (development)
 def reset_allowed_layers_cache():
     """Reset the allowed layers cache to force reload from config file."""
-    global ALLOWED_LAYERS_CACHE
-    ALLOWED_LAYERS_CACHE = None
+    ALLOWED_LAYERS_CACHE.clear()
     print("DEBUG: Allowed layers cache reset")
 
 
 def is_layer_allowed(layer_name, allowed_layers):
     """Check if a layer name matches any of the allowed patterns or exact names."""
+    exact_layers, layer_pattern = allowed_layers
     layer_upper = layer_name.upper()
+    return layer_upper in exact_layers or (
+        layer_pattern is not None and layer_pattern.match(layer_upper) is not None
+    )
 
-    for rule_type, rule_value in allowed_layers:
-        if rule_type == "exact" and layer_upper == rule_value:
-            return True
-        elif rule_type == "pattern":
-            # Convert regex pattern back to check for matching
-            import re
 
-            try:
-                if re.match(rule_value + "$", layer_upper):
-                    return True
-            except re.error:
-                continue
+# SVG post-processing patterns for generate_preview_svg
+_SVG_WIDTH_RE = re.compile(r'width="[^"]*"')
+_SVG_HEIGHT_RE = re.compile(r'height="[^"]*"')
+_SVG_WHITE_RE = re.compile(r"(stroke|fill):\s*#(?:ffffff|fff)\b")
+_SVG_WHITE_REPLACEMENTS = {"stroke": "stroke: #2d3748", "fill": "fill: #f0f0f0"}
 
-    return False
+
+def _replace_white(match):
+    return _SVG_WHITE_REPLACEMENTS[match.group(1)]
 
 
-def generate_preview_svg(doc, error_markers, config_path=None):
+# One ezdxf bbox cache per loaded document, dropped with the document
+_BBOX_CACHES = weakref.WeakKeyDictionary()
+
+
+def get_bbox_cache(doc):
+    """Shared ezdxf bbox cache for doc, so entity extents are computed once"""
+    cache = _BBOX_CACHES.get(doc)
+    if cache is None:
+        cache = _BBOX_CACHES[doc] = ezdxf_bbox.Cache()
+    return cache
+
+
+def index_entities_by_layer(msp):
+    """Group modelspace entities by layer name in a single pass."""
+    entities_by_layer = {}
+    for entity in msp:
+        entities_by_layer.setdefault(entity.dxf.layer, []).append(entity)
+    return entities_by_layer
+
+
+def generate_preview_svg(doc, error_markers, config_path=None, entities_by_layer=None):
     """
     Generate an SVG string of the DXF with error markers.
     Uses ezdxf's SVG output with proper viewBox that matches content bounds.
     If config_path is provided, only layers in that config are shown.
+    entities_by_layer may pass in an existing index_entities_by_layer() result.
     """
     try:
-        from ezdxf import bbox as ezdxf_bbox
-        import re
-
         msp = doc.modelspace()
 
         # Load allowed layers from config if provided
         allowed_layers = None
         if config_path and os.path.exists(config_path):
             allowed_layers = load_allowed_layers(config_path)
-            print(
-                f"DEBUG: Loaded {len(allowed_layers)} allowed layers from {config_path}"
-            )
+            exact_layers, layer_pattern = allowed_layers
+            if not exact_layers and layer_pattern is None:
+                allowed_layers = None
+
+        if entities_by_layer is None:
+            entities_by_layer = index_entities_by_layer(msp)
 
-        # Get entities for rendering
+        # Get entities for rendering; layers are filtered once each, not per entity
         target_entities = []
+        layers_to_show = set()
         if allowed_layers:
             # Only include entities on layers from the config
-            for entity in msp:
-                try:
-                    layer_name = entity.dxf.layer
-                    if is_layer_allowed(layer_name, allowed_layers):
-                        target_entities.append(entity)
-                except Exception:
-                    pass
+            for layer_name, entities in entities_by_layer.items():
+                if is_layer_allowed(layer_name, allowed_layers):
+                    target_entities.extend(entities)
+                    layers_to_show.add(layer_name)
             print(
                 f"DEBUG: Filtered to {len(target_entities)} entities on allowed layers"
             )
         else:
             # Fallback: show all non-ignored layers
-            for entity in msp:
-                try:
-                    layer_name = entity.dxf.layer
-                    if layer_name not in IGNORED_LAYERS:
-                        target_entities.append(entity)
-                except Exception:
-                    pass
+            for layer_name, entities in entities_by_layer.items():
+                if not is_ignored_layer(layer_name):
+                    target_entities.extend(entities)
+                    layers_to_show.add(layer_name)
 
         if not target_entities:
             print("DEBUG: No target entities found for preview")
             return None
 
         # Calculate bounding box of filtered entities
-        cache = ezdxf_bbox.Cache()
-        bounds = ezdxf_bbox.extents(target_entities, cache=cache)
+        bounds = ezdxf_bbox.extents(target_entities, cache=get_bbox_cache(doc))
         if not bounds.has_data:
             return None
 
@@ -529,37 +1034,40 @@ def generate_preview_svg(doc, error_markers, config_path=None):
         marker_radius = max(width, height) * 0.01
         marker_radius = max(marker_radius, 0.5)
 
-        for marker in error_markers:
-            x, y = marker["coords"]
-            msp.add_circle(
-                (x, y),
-                radius=marker_radius,
-                dxfattribs={"layer": marker_layer, "color": 1},
-            )
+        # Several errors often point at the same spot; draw one circle per point
+        marker_attribs = {"layer": marker_layer, "color": 1, "radius": marker_radius}
+        for x, y in dict.fromkeys(marker["coords"] for marker in error_markers):
+            msp.new_entity("CIRCLE", {**marker_attribs, "center": (x, y)})
 
         # Hide layers not in the allowed list (or ignored layers)
-        layers_to_show = set(e.dxf.layer for e in target_entities)
         layers_to_show.add(marker_layer)
 
-        for layer in doc.layers:
-            if layer.dxf.name not in layers_to_show:
-                layer.off()
-
-        # Render to SVG with explicit page size matching our bounds exactly
-        ctx = RenderContext(doc)
-        backend = SVGBackend()
-        frontend = Frontend(ctx, backend)
-        frontend.draw_layout(msp, finalize=True)
-
-        from ezdxf.addons.drawing.layout import Page, Settings
-
-        # Create a page that matches our bounds exactly
-        page = Page(width, height)
-        svg_string = backend.get_string(page=page, settings=Settings())
+        # Only switch off layers that are currently on, and remember them so the
+        # restore touches just those and leaves the document as it was
+        to_hide = [
+            layer
+            for layer in doc.layers
+            if layer.dxf.name not in layers_to_show and not layer.is_off()
+        ]
+        for layer in to_hide:
+            layer.off()
 
-        # Restore layers
-        for layer in doc.layers:
-            layer.on()
+        try:
+            # Render to SVG with explicit page size matching our bounds exactly
+            ctx = RenderContext(doc)
+            backend = SVGBackend()
+            frontend = Frontend(ctx, backend)
+            frontend.draw_layout(msp, finalize=True)
+
+            from ezdxf.addons.drawing.layout import Page, Settings
+
+            # Create a page that matches our bounds exactly
+            page = Page(width, height)
+            svg_string = backend.get_string(page=page, settings=Settings())
+        finally:
+            # Restore layers
+            for layer in to_hide:
+                layer.on()
 
         if not svg_string:
             return None
@@ -577,32 +1085,24 @@ def generate_preview_svg(doc, error_markers, config_path=None):
             disp_height = min(max_display_height, max(700, height * 5))
             disp_width = disp_height * aspect
 
+        # Split off the opening <svg ...> tag so the size/style edits only touch
+        # that short head and the (large) body is rewritten exactly once
+        prolog, svg_tag, rest = svg_string.partition("<svg")
+        svg_attrs, tag_end, body = rest.partition(">")
+        head = prolog + svg_tag + svg_attrs + tag_end
+
         # Replace the SVG dimensions but keep ezdxf's viewBox and transforms
         # ezdxf generates proper viewBox and transform to handle Y-axis flip
-        svg_string = re.sub(
-            r'width="[^"]*"', f'width="{disp_width:.0f}"', svg_string, count=1
-        )
-        svg_string = re.sub(
-            r'height="[^"]*"', f'height="{disp_height:.0f}"', svg_string, count=1
-        )
+        head = _SVG_WIDTH_RE.sub(f'width="{disp_width:.0f}"', head, count=1)
+        head = _SVG_HEIGHT_RE.sub(f'height="{disp_height:.0f}"', head, count=1)
 
         # Add background style if not present
-        if "style=" not in svg_string[:200]:
-            svg_string = re.sub(
-                r"<svg", '<svg style="background:#f5f5f5;"', svg_string, count=1
-            )
+        if "style=" not in head:
+            head = head.replace("<svg", '<svg style="background:#f5f5f5;"', 1)
 
-        # Fix white strokes to dark color for visibility on light background
-        svg_string = svg_string.replace("stroke: #ffffff", "stroke: #2d3748")
-        svg_string = svg_string.replace("stroke:#ffffff", "stroke: #2d3748")
-        svg_string = svg_string.replace("stroke: #fff", "stroke: #2d3748")
-        svg_string = svg_string.replace("stroke:#fff", "stroke: #2d3748")
-
-        # Fix white fills to light gray
-        svg_string = svg_string.replace("fill: #ffffff", "fill: #f0f0f0")
-        svg_string = svg_string.replace("fill:#ffffff", "fill: #f0f0f0")
-
-        return svg_string
+        # Fix white strokes to dark color and white fills to light gray for
+        # visibility on the light background, in a single pass
+        return "".join((head, _SVG_WHITE_RE.sub(_replace_white, body)))
 
     except Exception as e:
         print(f"SVG Generation Error: {e}")
@@ -611,135 +1111,64 @@ def generate_preview_svg(doc, error_markers, config_path=None):
         traceback.print_exc()
         return None
 
-        # Calculate bounding box of all entities
-        cache = ezdxf_bbox.Cache()
-        bounds = ezdxf_bbox.extents(target_entities, cache=cache)
-        if not bounds.has_data:
-            return None
-
-        min_x, max_x = bounds.extmin.x, bounds.extmax.x
-        min_y, max_y = bounds.extmin.y, bounds.extmax.y
-        width = max_x - min_x
-        height = max_y - min_y
-
-        # Handle case where all coordinates are the same (single point)
-        if width < 0.001:
-            width = 100
-            min_x -= 50
-            max_x += 50
-        if height < 0.001:
-            height = 100
-            min_y -= 50
-            max_y += 50
-
-        # Add padding (5%)
-        padding = max(width, height) * 0.05
-        min_x -= padding
-        max_x += padding
-        min_y -= padding
-        max_y += padding
-        width = max_x - min_x
-        height = max_y - min_y
-
-        # Add error markers
-        marker_layer = "SYS_ERROR_MARKERS"
-        if marker_layer not in doc.layers:
-            doc.layers.add(marker_layer, color=1)
-
-        marker_radius = max(width, height) * 0.01
-        marker_radius = max(marker_radius, 0.5)
-
-        for marker in error_markers:
-            x, y = marker["coords"]
-            msp.add_circle(
-                (x, y),
-                radius=marker_radius,
-                dxfattribs={"layer": marker_layer, "color": 1},
-            )
-
-        # Hide ignored layers for cleaner preview
-        for layer in doc.layers:
-            if layer.dxf.name in IGNORED_LAYERS:
-                layer.off()
-
-        # Render to SVG with explicit page size matching our bounds exactly
-        ctx = RenderContext(doc)
-        backend = SVGBackend()
-        frontend = Frontend(ctx, backend)
-        frontend.draw_layout(msp, finalize=True)
-
-        from ezdxf.addons.drawing.layout import Page, Settings
-
-        # Create a page that matches our bounds exactly
-        page = Page(width, height)
-        svg_string = backend.get_string(page=page, settings=Settings())
-
-        # Restore layers
-        for layer in doc.layers:
-            layer.on()
-
-        if not svg_string:
-            return None
-
-        # Calculate display size for PC browser
-        max_display_width = 1400
-        max_display_height = 900
-
-        aspect = width / height if height > 0 else 1
-
-        if aspect >= 1:
-            disp_width = min(max_display_width, max(900, width * 5))
-            disp_height = disp_width / aspect
-        else:
-            disp_height = min(max_display_height, max(700, height * 5))
-            disp_width = disp_height * aspect
 
-        # Replace the SVG dimensions but keep ezdxf's viewBox and transforms
-        # ezdxf generates proper viewBox and transform to handle Y-axis flip
-        svg_string = re.sub(
-            r'width="[^"]*"', f'width="{disp_width:.0f}"', svg_string, count=1
-        )
-        svg_string = re.sub(
-            r'height="[^"]*"', f'height="{disp_height:.0f}"', svg_string, count=1
-        )
-
-        # Add background style if not present
-        if "style=" not in svg_string[:200]:
-            svg_string = re.sub(
-                r"<svg", '<svg style="background:#f5f5f5;"', svg_string, count=1
-            )
-
-        # Fix white strokes to dark color for visibility on light background
-        svg_string = svg_string.replace("stroke: #ffffff", "stroke: #2d3748")
-        svg_string = svg_string.replace("stroke:#ffffff", "stroke: #2d3748")
-        svg_string = svg_string.replace("stroke: #fff", "stroke: #2d3748")
-        svg_string = svg_string.replace("stroke:#fff", "stroke: #2d3748")
+# DXF color to RGB mapping for standard AutoCAD colors
+# Standard AutoCAD colors 1-255 mapped to RGB values
+ACI_COLORS = {
+    0: (0, 0, 0),  # ByBlock (special)
+    1: (255, 0, 0),  # Red
+    2: (255, 255, 0),  # Yellow
+    3: (0, 255, 0),  # Green
+    4: (0, 255, 255),  # Cyan
+    5: (0, 0, 255),  # Blue
+    6: (255, 0, 255),  # Magenta
+    7: (255, 255, 255),  # White/Black
+    8: (128, 128, 128),  # Dark Gray
+    9: (192, 192, 192),  # Light Gray
+    # Common colors
+    10: (255, 0, 0),  # Red
+    30: (0, 127, 0),  # Dark Green
+    40: (127, 0, 0),  # Dark Red
+    50: (127, 63, 0),  # Brown
+    80: (127, 127, 0),  # Olive
+    100: (255, 127, 0),  # Orange
+    120: (127, 0, 127),  # Dark Magenta
+    140: (0, 127, 127),  # Dark Cyan
+    160: (192, 192, 192),  # Light Gray
+    180: (128, 128, 128),  # Dark Gray
+    256: (128, 128, 128),  # ByLayer - use layer color
+}
 
-        # Fix white fills to light gray
-        svg_string = svg_string.replace("fill: #ffffff", "fill: #f0f0f0")
-        svg_string = svg_string.replace("fill:#ffffff", "fill: #f0f0f0")
 
-        # Scale down stroke widths - they are too thick in the preview
-        # Reduce all stroke widths by 60% to make lines thinner
-        def scale_stroke_width(match):
-            try:
-                width = float(match.group(1))
-                # Reduce by 60%, with minimum of 0.3 and maximum of 2.0
-                new_width = max(0.3, min(width * 0.4, 2.0))
-                return f"stroke-width: {new_width:.2f}"
-            except:
-                return match.group(0)
+def _generated_aci_rgb(color_code):
+    """Generate a color based on the index for colors not in ACI_COLORS"""
+    return (
+        (color_code * 47) % 256,
+        (color_code * 113) % 256,
+        (color_code * 179) % 256,
+    )
 
-        svg_string = re.sub(r"stroke-width:\s*([\d.]+)", scale_stroke_width, svg_string)
 
-        return svg_string
+# Lookup table for every ACI code 0-256, built once at import
+ACI_RGB_LUT = tuple(
+    ACI_COLORS.get(code) or _generated_aci_rgb(code) for code in range(257)
+)
 
-    except Exception as e:
-        print(f"SVG Generation Error: {e}")
-        import traceback
 
-        traceback.print_exc()
-        return None
+def get_color_rgb(color_code, true_color=None):
+    """RGB tuple for a layer's true color, or its ACI color code"""
+    if true_color is not None and true_color > 0:
+        # True color is stored as 24-bit RGB. Plain shifts are the cheapest way to
+        # split it; batching a whole layer table through numpy measured slower,
+        # even at 5000 layers, once the result is turned back into Python ints.
+        r = (true_color >> 16) & 0xFF
+        g = (true_color >> 8) & 0xFF
+        b = true_color & 0xFF
+        return (r, g, b)
+    if 0 <= color_code < len(ACI_RGB_LUT):
+        return ACI_RGB_LUT[color_code]
+    # Out of range, e.g. the negative code of a layer that is switched off
+    return _generated_aci_rgb(color_code)
 
 
 def get_layer_analysis_data(doc):
@@ -749,65 +1178,13 @@ def get_layer_analysis_data(doc):
     """
     layer_analysis = []
 
-    # DXF color to RGB mapping for standard AutoCAD colors
-    # Standard AutoCAD colors 1-255 mapped to RGB values
-    aci_colors = {
-        0: (0, 0, 0),  # ByBlock (special)
-        1: (255, 0, 0),  # Red
-        2: (255, 255, 0),  # Yellow
-        3: (0, 255, 0),  # Green
-        4: (0, 255, 255),  # Cyan
-        5: (0, 0, 255),  # Blue
-        6: (255, 0, 255),  # Magenta
-        7: (255, 255, 255),  # White/Black
-        8: (128, 128, 128),  # Dark Gray
-        9: (192, 192, 192),  # Light Gray
-        # Common colors
-        10: (255, 0, 0),  # Red
-        30: (0, 127, 0),  # Dark Green
-        40: (127, 0, 0),  # Dark Red
-        50: (127, 63, 0),  # Brown
-        80: (127, 127, 0),  # Olive
-        100: (255, 127, 0),  # Orange
-        120: (127, 0, 127),  # Dark Magenta
-        140: (0, 127, 127),  # Dark Cyan
-        160: (192, 192, 192),  # Light Gray
-        180: (128, 128, 128),  # Dark Gray
-    }
-
-    # Default for colors not in mapping
-    def get_color_rgb(color_code, true_color=None):
-        if true_color is not None and true_color > 0:
-            # True color is stored as 24-bit RGB
-            r = (true_color >> 16) & 0xFF
-            g = (true_color >> 8) & 0xFF
-            b = true_color & 0xFF
-            return (r, g, b)
-        elif color_code in aci_colors:
-            return aci_colors[color_code]
-        elif color_code == 256:
-            # ByLayer - use layer color
-            return (128, 128, 128)
-        elif color_code == 0:
-            # ByBlock
-            return (0, 0, 0)
-        else:
-            # Generate a color based on the index
-            # Simple algorithm for colors not in our mapping
-            return (
-                (color_code * 47) % 256,
-                (color_code * 113) % 256,
-                (color_code * 179) % 256,
-            )
-
     for layer in doc.layers:
-        layer_name = layer.dxf.name
+        dxf = layer.dxf
+        layer_name = dxf.name
 
-        # Get color
-        color_code = layer.dxf.color
-        true_color = None
-        if layer.dxf.hasattr("true_color"):
-            true_color = layer.dxf.true_color
+        # Get color (ezdxf returns None for an unset true_color)
+        color_code = dxf.color
+        true_color = dxf.true_color
 
         rgb = get_color_rgb(color_code, true_color)
         color_integer = str(color_code)
@@ -816,15 +1193,13 @@ def get_layer_analysis_data(doc):
         color_swatch = f"rgb({rgb[0]}, {rgb[1]}, {rgb[2]})"
 
         # Get line type
-        line_type = "Continuous"
-        if layer.dxf.hasattr("linetype"):
-            line_type = layer.dxf.linetype
+        line_type = getattr(dxf, "linetype", "Continuous")
 
         # Get visibility
         visibility = "Visible"
         if layer.is_off():
             visibility = "Hidden"
-        elif layer.dxf.hasattr("frozen") and layer.dxf.frozen:
+        elif layer.is_frozen():
             visibility = "Frozen"
 
         layer_analysis.append(
@@ -838,12 +1213,374 @@ def get_layer_analysis_data(doc):
         )
 
     # Sort by layer name
-    layer_analysis.sort(key=lambda x: x["layer_name"])
+    layer_analysis.sort(key=itemgetter("layer_name"))
     return layer_analysis
 
 
-def validate_dxf_content(doc, master_rules, config_path=None):
-    """Validate DXF content against master rules, checking units and layer specifications"""
+def classify_layers(dxf_layers, match_rules):
+    """
+    Classify every DXF layer in one pass.
+    Returns (occupancy_colors, matched_rule_indices, pending_layers):
+    - occupancy_colors: colors of the BLT_UP_AREA layers
+    - matched_rule_indices: indices of all rules matched by any layer name
+    - pending_layers: (name, rule_indices, color, true_color) for each layer
+      to validate, with the layer's colors read once here
+    """
+    occupancy_colors = set()
+    matched_rule_indices = set()
+    pending_layers = []
+
+    for name, layer in dxf_layers.items():
+        # Each DXF attribute access has a cost, so colors are read once;
+        # an unset true color reads as None
+        dxf = layer.dxf
+        color = dxf.color
+        true_color = dxf.true_color
+
+        if _BLT_UP_RE.match(name):
+            occupancy_colors.add(color)
+            # Include true color if present
+            if true_color is not None:
+                occupancy_colors.add(true_color)
+
+        # Ignored layers still count towards mandatory rules
+        rule_indices = match_rules(name)
+        matched_rule_indices.update(rule_indices)
+
+        # Ignore special and excluded layers
+        if not is_ignored_layer(name):
+            pending_layers.append((name, rule_indices, color, true_color))
+
+    return occupancy_colors, matched_rule_indices, pending_layers
+
+
+def _validate_layer(
+    name,
+    matched_rules,
+    layer_color,
+    layer_true_color,
+    layer_entities,
+    occupancy_colors,
+    errors,
+    warnings,
+    fix_actions,
+    error_markers,
+):
+    """
+    Validate one DXF layer against the rules its name matched.
+    Returns the layer_info dict; file-level errors, warnings, fix actions and
+    preview markers are appended to the lists passed in.
+    """
+    layer_info = {"name": name, "status": "valid", "messages": []}
+
+    if not matched_rules:
+        layer_info["status"] = "warning"
+        layer_info["messages"].append("Layer not found in master guidelines")
+        warnings.append(f"Layer '{name}': Unknown layer not in guidelines")
+    else:
+        # Check if layer matches ANY of the allowed configurations
+        # If multiple rules match, we allow the layer if it satisfies ANY of them
+        # This handles cases where the same layer name pattern is used for multiple features with different colors
+
+        valid_match_found = False
+        allowed_colors = []
+        allowed_types = []
+
+        for rule in matched_rules:
+            required_color = rule["Color Code"]
+            required_type = rule["Type"]  # Keep track of types too
+            allowed_colors.append(required_color)
+            allowed_types.append(required_type)
+
+            color_valid = _color_matches(
+                _parse_color_spec(required_color),
+                layer_color,
+                layer_true_color,
+                occupancy_colors,
+            )
+
+            if color_valid:
+                valid_match_found = True
+                # If color matched, we still need to validate Entity Type and Geometry for this rule
+                # But we don't break immediately if we want to support "multiple valid rules" scenarios fully
+                # However, strictly speaking, if it matches a rule name and color, it SHOULD match that rule's type.
+                # Let's keep valid_match_found = True but flag issues if Type/Geometry fail.
+                break
+
+        # --- Enhanced Validation: Entity Type & Geometry ---
+        # We check against the BEST matching rule (where color matched).
+        # If no color matched, we check against ALL matched rules (ambiguous, but best effort).
+
+        # Check all candidate rules. If ANY is fully valid
+        # (Color + Type + Geometry), the layer is valid.
+        rules_to_check = matched_rules
+
+        # Reset status to re-evaluate based on Type/Geometry
+        # If valid_match_found was True (Color OK), we start as Valid, but might downgrade to Error/Warning
+        # If valid_match_found was False (Color Fail), we start as Error.
+
+        final_layer_status = "valid" if valid_match_found else "error"
+        # Unique messages in first-seen order (dicts used as ordered sets)
+        type_errors = {}
+        geometry_errors = {}
+
+        # --- Phase 2: Data Extraction & Validation ---
+        layer_data = []  # To store "Area: 50sqm" or "Text: 5000L"
+        total_layer_area = 0.0
+        text_values = {}  # Unique texts, in first-seen order
+
+        if len(layer_entities) == 0:
+            # Empty layer - usually not an error unless mandatory (handled elsewhere), but good to note
+            pass
+        else:
+            # For each candidate rule, check if entities comply
+            # We need at least ONE rule where (Color matches AND Type matches AND Geometry matches)
+
+            fully_compliant_rule_found = False
+
+            # Check for "Single Value" constraint (from user request 2)
+            is_single_value_layer = any(
+                "VOLTAGE" in r["Layer Name"] for r in rules_to_check
+            )
+
+            # Bucket the layer's entities by DXF type once, so each rule
+            # checks types per bucket and only visits the relevant buckets
+            entities_by_type = {}
+            for e in layer_entities:
+                entities_by_type.setdefault(e.dxftype(), []).append(e)
+
+            # Per-entity results do not depend on the rule, so they are
+            # computed by the first rule that needs them and then reused
+            entity_centers = {}
+            polygon_checks = None  # [(entity, is_closed, area)]
+            text_checks = None  # [(text, error message or None)]
+
+            def center_of(e):
+                pt = entity_centers.get(e)
+                if pt is None:
+                    pt = entity_centers[e] = get_entity_center(e)
+                return pt
+
+            for rule in rules_to_check:
+                required_type = rule.get("Type")
+                required_color = rule.get("Color Code")
+
+                # Once a rule fully passes, the layer is valid and its errors
+                # are never reported; later rules only matter if they can
+                # replace the displayed area or text values
+                if fully_compliant_rule_found and required_type not in (
+                    "Polygon",
+                    "Text",
+                ):
+                    continue
+
+                # 1. Check Color (Reuse previous result logic ideally, but re-evaluating for clarity)
+                # ... We already know if 'valid_match_found' (color ok) for at least one rule.
+
+                # Let's simplify:
+                # If Color is Wrong -> Error (already handled).
+                # If Color is OK -> Check Type & Geometry.
+
+                # None for unknown types or "Any": no type check
+                valid_dxf_types = ENTITY_TYPE_MAPPING.get(required_type)
+
+                rule_type_valid = True
+                rule_geometry_valid = True
+                rule_text_valid = True
+
+                current_type_errors = {}
+                current_geometry_errors = {}
+                current_text_errors = {}
+
+                # Reset calculations for this rule iteration
+                current_rule_area = 0.0
+                current_rule_texts = {}
+
+                # Type Check
+                if valid_dxf_types:
+                    for dxftype, typed_entities in entities_by_type.items():
+                        if dxftype in valid_dxf_types:
+                            continue
+                        rule_type_valid = False
+                        err_msg = f"Invalid Entity: Found '{dxftype}' on layer requiring '{required_type}'"
+                        current_type_errors[err_msg] = None
+                        for e in typed_entities:
+                            if len(error_markers) >= MAX_MARKERS:
+                                break
+                            # Add Marker
+                            pt = center_of(e)
+                            error_markers.append(
+                                {"coords": (pt[0], pt[1]), "msg": err_msg}
+                            )
+
+                # Geometry Check (Closed Polygon) & Area Calculation
+                if required_type == "Polygon":
+                    if polygon_checks is None:
+                        polygon_checks = check_layer_polygons(entities_by_type)
+
+                    for e, is_closed, area in polygon_checks:
+                        if not is_closed:
+                            rule_geometry_valid = False
+                            err_msg = (
+                                "Open Polygon detected. Area cannot be calculated."
+                            )
+                            current_geometry_errors[err_msg] = None
+                            # Add Marker
+                            if len(error_markers) < MAX_MARKERS:
+                                pt = center_of(e)
+                                error_markers.append(
+                                    {"coords": (pt[0], pt[1]), "msg": err_msg}
+                                )
+                        else:
+                            # Valid closed polygon - Calculate Area
+                            current_rule_area += area
+
+                # Text Content Validation
+                if required_type == "Text":
+                    if text_checks is None:
+                        # The layer name fixes the expected format once (as in
+                        # validate_text_content); None means any text is fine
+                        text_kind = _text_rule_kind(name)
+                        text_checks = []
+                        for dxftype in _TEXT_TYPES:
+                            for e in entities_by_type.get(dxftype, ()):
+                                text_content = getattr(e.dxf, "text", "")
+                                # The message is None when the text is valid
+                                err_msg = None
+                                if text_kind is not None:
+                                    _, err_msg = _check_text_format(
+                                        text_kind, text_content.strip().upper()
+                                    )
+                                text_checks.append((text_content, err_msg))
+
+                    for text_content, err_msg in text_checks:
+                        if err_msg is not None:
+                            rule_text_valid = False
+                            current_text_errors[
+                                f"Invalid Text: '{text_content}' ({err_msg})"
+                            ] = None
+                        current_rule_texts[text_content] = None
+
+                if rule_type_valid and rule_geometry_valid and rule_text_valid:
+                    if valid_match_found:
+                        fully_compliant_rule_found = True
+
+                        # Store Data for Display (Area / Text) if this rule matched
+                        if required_type == "Polygon" and current_rule_area > 0:
+                            total_layer_area = current_rule_area
+                        if required_type == "Text" and current_rule_texts:
+                            text_values = current_rule_texts
+
+                if not rule_type_valid:
+                    type_errors.update(current_type_errors)
+                if not rule_geometry_valid:
+                    geometry_errors.update(current_geometry_errors)
+                if not rule_text_valid:
+                    # Treat text content errors as type/data errors
+                    type_errors.update(current_text_errors)
+
+            # Summarize findings
+            # If we had a color match, but Type/Geometry failed for ALL matching rules -> Error
+            if valid_match_found:
+                if not fully_compliant_rule_found:
+                    # Report errors from the first matching rule (or unique errors) to avoid spam
+                    if type_errors:
+                        final_layer_status = "error"
+                        layer_info["messages"].extend(
+                            heapq.nsmallest(3, type_errors)
+                        )  # Limit msgs
+                    if geometry_errors:
+                        final_layer_status = "error"
+                        layer_info["messages"].extend(
+                            heapq.nsmallest(3, geometry_errors)
+                        )
+                else:
+                    # Valid Layer - Add Data Info
+                    if total_layer_area > 0:
+                        layer_data.append(f"Area: {total_layer_area:.2f} sq.m")
+
+                    if text_values:
+                        # Single Value Constraint Check
+                        # text_values is already deduplicated
+                        if is_single_value_layer and len(text_values) > 1:
+                            final_layer_status = "error"
+                            layer_info["messages"].append(
+                                f"Multiple values found for Voltage: {', '.join(sorted(text_values))}. Expected single unique value."
+                            )
+                        else:
+                            # Only the three shown need ordering
+                            layer_data.append(
+                                f"Text: {', '.join(heapq.nsmallest(3, text_values))}"
+                                + ("..." if len(text_values) > 3 else "")
+                            )
+
+        layer_info["status"] = final_layer_status
+        layer_info["data_attributes"] = layer_data  # New field for UI
+
+        # If layer color is invalid, check if all entities have valid explicit colors
+        if not valid_match_found and layer_info["status"] == "error":
+            allowed_specs = [_parse_color_spec(c) for c in set(allowed_colors)]
+            if len(layer_entities) > 0 and all(
+                _entity_color_matches(e, allowed_specs, occupancy_colors)
+                for e in layer_entities
+            ):
+                layer_info["status"] = "valid"
+                valid_match_found = True
+
+        if not valid_match_found:
+            layer_info["status"] = "error"
+            # Get unique allowed colors for error message
+            unique_colors = sorted(list(set(allowed_colors)))
+
+            # Expand "As per Sub-Occupancy" for better error message
+            expanded_colors = []
+            fix_color_code = None
+
+            for c in unique_colors:
+                if c in _OCCUPANCY_COLOR_CODES:
+                    if not occupancy_colors:
+                        expanded_colors.append(
+                            "As per Sub-Occupancy (No valid BLT_UP_AREA layers found to define colors)"
+                        )
+                    else:
+                        occ_list = sorted([str(oc) for oc in occupancy_colors])
+                        expanded_colors.append(
+                            f"As per Sub-Occupancy ({', '.join(occ_list)})"
+                        )
+                else:
+                    expanded_colors.append(c)
+                    # Pick first valid color as fix target if not yet set
+                    if not fix_color_code:
+                        fix_color_code = _fix_color_target(c)
+
+            msg = f"Incorrect color. Expected one of: {', '.join(expanded_colors)}, Found: {layer_color}"
+            if layer_true_color is not None:
+                msg += f" (True Color {layer_true_color})"
+            layer_info["messages"].append(msg)
+            errors.append(f"Layer '{name}': {msg}")
+
+            if fix_color_code:
+                fix_actions.append(
+                    {"type": "fix_color", "layer": name, "color": fix_color_code}
+                )
+
+    return layer_info
+
+
+def validate_dxf_content(
+    doc,
+    master_rules,
+    config_path=None,
+    include_preview=False,
+    include_analysis=False,
+    entities_by_layer=None,
+):
+    """
+    Validate DXF content against master rules, checking units and layer
+    specifications. The preview SVG and layer analysis table are only built
+    when include_preview / include_analysis are set; otherwise they are None.
+    entities_by_layer may pass in an existing index_entities_by_layer() result.
+    """
     errors = []
     warnings = []
     fix_actions = []  # List of fixable actions for LISP script
@@ -902,43 +1639,24 @@ def validate_dxf_content(doc, master_rules, config_path=None):
 
     # 2. Perform layer analysis and validation
     dxf_layers = {layer.dxf.name: layer for layer in doc.layers}
+    # One pass over modelspace instead of an entity query per layer
+    if entities_by_layer is None:
+        entities_by_layer = index_entities_by_layer(doc.modelspace())
 
-    # Extract allowed occupancy colors from BLT_UP_AREA layers
-    occupancy_colors = set()
-    blt_up_pattern = re.compile(r"^BLK_-?\d+_FLR_-?\d+_BLT_UP_AREA$")
-
-    for name, layer in dxf_layers.items():
-        if blt_up_pattern.match(name):
-            occupancy_colors.add(layer.dxf.color)
-            # Include true color if present
-            if layer.dxf.hasattr("true_color"):
-                occupancy_colors.add(layer.dxf.true_color)
-
-    # Compile regex patterns from master rules for efficient matching
-    compiled_rules = []
-    mandatory_rules = []
-
-    for rule in master_rules:
-        pattern = parse_layer_pattern(rule["Layer Name"])
-        compiled_rule = {"regex": re.compile(pattern), "rule": rule}
-        compiled_rules.append(compiled_rule)
+    # All rule patterns fused into one regex, cached across uploads together
+    # with the indices of the mandatory rules
+    match_rules, mandatory_rule_indices = compile_rules(master_rules)
 
-        # Track mandatory rules
-        if rule.get("Requirement", "").lower().startswith("mandatory"):
-            mandatory_rules.append(compiled_rule)
+    occupancy_colors, matched_rule_indices, pending_layers = classify_layers(
+        dxf_layers, match_rules
+    )
 
     # 3. Check for Missing Mandatory Layers
-    existing_layer_names = set(dxf_layers.keys())
-    for mr in mandatory_rules:
-        rule = mr["rule"]
-        regex = mr["regex"]
-
-        # Check if any existing layer matches this mandatory rule
-        match_found = False
-        for layer_name in existing_layer_names:
-            if regex.match(layer_name):
-                match_found = True
-                break
+    for rule_index in mandatory_rule_indices:
+        rule = master_rules[rule_index]
+
+        # A mandatory rule is satisfied if any existing layer matched it
+        match_found = rule_index in matched_rule_indices
 
         if not match_found:
             errors.append(
@@ -946,29 +1664,13 @@ def validate_dxf_content(doc, master_rules, config_path=None):
             )
 
             # Determine correct color for fix
-            fix_color = "7"  # Default white
             required_color = rule.get("Color Code", "7")
-
-            # Try to resolve color code
-            if required_color in ["Any", "NA", "N/A", "ANY"]:
-                fix_color = "7"
-            elif required_color in [
-                "As per Sub-Occupancy",
-                "As per sub-occupancy type",
-            ]:
+            if required_color in _OCCUPANCY_COLOR_CODES:
                 # Can't auto-fix safely
                 fix_color = None
-            elif required_color.startswith("RGB"):
-                fix_color = f"T {required_color.replace('RGB', '').strip()}"
             else:
-                # Take first number if multiple
-                try:
-                    parts = str(required_color).split(",")
-                    match = re.search(r"(\d+)", parts[0])
-                    if match:
-                        fix_color = match.group(1)
-                except:
-                    pass
+                # Default white when the code names no specific color
+                fix_color = _fix_color_target(required_color) or "7"
 
             if fix_color:
                 fix_actions.append(
@@ -982,507 +1684,32 @@ def validate_dxf_content(doc, master_rules, config_path=None):
     # Validate each layer in the DXF
     validated_layers = []
 
-    for name, layer in dxf_layers.items():
-        # Ignore special and excluded layers
-        if name in IGNORED_LAYERS:
-            continue
-
-        matched_rules = []
-        for cr in compiled_rules:
-            if cr["regex"].match(name):
-                matched_rules.append(cr["rule"])
-
-        layer_info = {"name": name, "status": "valid", "messages": []}
-
-        if not matched_rules:
-            layer_info["status"] = "warning"
-            layer_info["messages"].append("Layer not found in master guidelines")
-            warnings.append(f"Layer '{name}': Unknown layer not in guidelines")
-        else:
-            # Check if layer matches ANY of the allowed configurations
-            # If multiple rules match, we allow the layer if it satisfies ANY of them
-            # This handles cases where the same layer name pattern is used for multiple features with different colors
-
-            valid_match_found = False
-            allowed_colors = []
-            allowed_types = []
-
-            for rule in matched_rules:
-                required_color = rule["Color Code"]
-                required_type = rule["Type"]  # Keep track of types too
-                allowed_colors.append(required_color)
-                allowed_types.append(required_type)
-
-                current_color = layer.dxf.color
-                current_true_color = (
-                    layer.dxf.true_color if layer.dxf.hasattr("true_color") else None
-                )
-
-                color_valid = False
-
-                if required_color in [
-                    "As per Sub-Occupancy",
-                    "As per sub-occupancy type",
-                ]:
-                    if current_color in occupancy_colors or (
-                        current_true_color is not None
-                        and current_true_color in occupancy_colors
-                    ):
-                        color_valid = True
-                    elif not occupancy_colors:
-                        color_valid = False
-                    else:
-                        color_valid = False
-                elif required_color.startswith("RGB"):
-                    try:
-                        parts = [
-                            int(x.strip())
-                            for x in required_color.replace("RGB", "").split(",")
-                        ]
-                        if len(parts) == 3:
-                            expected_int = colors.rgb2int(
-                                (parts[0], parts[1], parts[2])
-                            )
-                            if current_true_color == expected_int:
-                                color_valid = True
-                    except:
-                        pass
-                elif required_color in ["Any", "NA", "N/A", "ANY"]:
-                    color_valid = True
-                else:
-                    # Handle complex color codes like "1, 2, 3", "1 (M)"
-                    try:
-                        allowed_list = []
-                        for part in str(required_color).split(","):
-                            match = re.search(r"(\d+)", part)
-                            if match:
-                                allowed_list.append(int(match.group(1)))
-
-                        if current_color in allowed_list:
-                            color_valid = True
-                    except:
-                        pass
-
-                if color_valid:
-                    valid_match_found = True
-                    # If color matched, we still need to validate Entity Type and Geometry for this rule
-                    # But we don't break immediately if we want to support "multiple valid rules" scenarios fully
-                    # However, strictly speaking, if it matches a rule name and color, it SHOULD match that rule's type.
-                    # Let's keep valid_match_found = True but flag issues if Type/Geometry fail.
-                    break
-
-            # --- Enhanced Validation: Entity Type & Geometry ---
-            # We check against the BEST matching rule (where color matched).
-            # If no color matched, we check against ALL matched rules (ambiguous, but best effort).
-
-            rules_to_check = []
-            if valid_match_found:
-                # Find the specific rule that matched color
-                for rule in matched_rules:
-                    # Re-verify color match to find the specific rule
-                    # (Refactoring note: could optimize to capture this index above)
-                    r_color = rule["Color Code"]
-                    c_valid = False
-
-                    # ... (Simple logic copy to re-confirm) ...
-                    # For simplicity, if we found a valid match, we assume the first rule
-                    # that matches color is the intended one.
-                    # Or we just check all matched rules?
-                    # Better: Check all matched rules. If ANY is fully valid (Color + Type + Geometry), it's Valid.
-                    pass
-                rules_to_check = matched_rules  # Check all candidate rules
-            else:
-                rules_to_check = matched_rules
-
-            # Reset status to re-evaluate based on Type/Geometry
-            # If valid_match_found was True (Color OK), we start as Valid, but might downgrade to Error/Warning
-            # If valid_match_found was False (Color Fail), we start as Error.
-
-            final_layer_status = "valid" if valid_match_found else "error"
-            type_errors = []
-            geometry_errors = []
-
-            # Retrieve entities once
-            msp = doc.modelspace()
-            layer_entities = msp.query(f'*[layer=="{name}"]')
-
-            # --- Phase 2: Data Extraction & Validation ---
-            layer_data = []  # To store "Area: 50sqm" or "Text: 5000L"
-            total_layer_area = 0.0
-            text_values = []
-
-            if len(layer_entities) == 0:
-                # Empty layer - usually not an error unless mandatory (handled elsewhere), but good to note
-                pass
-            else:
-                # For each candidate rule, check if entities comply
-                # We need at least ONE rule where (Color matches AND Type matches AND Geometry matches)
-
-                fully_compliant_rule_found = False
-
-                # Check for "Single Value" constraint (from user request 2)
-                is_single_value_layer = any(
-                    "VOLTAGE" in r["Layer Name"] for r in rules_to_check
-                )
-
-                for rule in rules_to_check:
-                    required_type = rule.get("Type")
-                    required_color = rule.get("Color Code")
-
-                    # 1. Check Color (Reuse previous result logic ideally, but re-evaluating for clarity)
-                    # ... We already know if 'valid_match_found' (color ok) for at least one rule.
-
-                    # Let's simplify:
-                    # If Color is Wrong -> Error (already handled).
-                    # If Color is OK -> Check Type & Geometry.
-
-                    valid_dxf_types = ENTITY_TYPE_MAPPING.get(required_type)
-                    if not valid_dxf_types and required_type:
-                        # Fallback for unknown types or "Any"
-                        valid_dxf_types = set()
-
-                    rule_type_valid = True
-                    rule_geometry_valid = True
-                    rule_text_valid = True
-
-                    current_type_errors = []
-                    current_geometry_errors = []
-                    current_text_errors = []
-
-                    # Reset calculations for this rule iteration
-                    current_rule_area = 0.0
-                    current_rule_texts = []
-
-                    for e in layer_entities:
-                        dxftype = e.dxftype()
-
-                        # Type Check
-                        if valid_dxf_types and dxftype not in valid_dxf_types:
-                            rule_type_valid = False
-                            err_msg = f"Invalid Entity: Found '{dxftype}' on layer requiring '{required_type}'"
-                            current_type_errors.append(err_msg)
-                            # Add Marker
-                            pt = get_entity_center(e)
-                            error_markers.append(
-                                {"coords": (pt[0], pt[1]), "msg": err_msg}
-                            )
-
-                        # Geometry Check (Closed Polygon) & Area Calculation
-                        if required_type == "Polygon" and dxftype in (
-                            "LWPOLYLINE",
-                            "POLYLINE",
-                            "HATCH",
-                        ):
-                            is_closed = False
-                            if hasattr(e, "is_closed") and e.is_closed:
-                                is_closed = True
-                            elif dxftype == "HATCH":
-                                is_closed = True  # Hatches are generally closed areas
-                            else:
-                                # Check start/end points manually
-                                try:
-                                    if dxftype == "LWPOLYLINE":
-                                        pts = e.get_points()
-                                        if len(pts) > 2 and pts[0] == pts[-1]:
-                                            is_closed = True
-                                    elif dxftype == "POLYLINE":
-                                        pts = list(e.points())
-                                        if len(pts) > 2 and pts[0] == pts[-1]:
-                                            is_closed = True
-                                except:
-                                    pass
-
-                            if not is_closed:
-                                rule_geometry_valid = False
-                                err_msg = (
-                                    "Open Polygon detected. Area cannot be calculated."
-                                )
-                                current_geometry_errors.append(err_msg)
-                                # Add Marker
-                                pt = get_entity_center(e)
-                                error_markers.append(
-                                    {"coords": (pt[0], pt[1]), "msg": err_msg}
-                                )
-                            else:
-                                # Valid closed polygon - Calculate Area
-                                current_rule_area += calculate_entity_area(e)
-
-                        # Text Content Validation
-                        if required_type == "Text" and dxftype in ("TEXT", "MTEXT"):
-                            text_content = e.dxf.text if hasattr(e.dxf, "text") else ""
-                            is_valid_text, err_msg = validate_text_content(
-                                text_content, name
-                            )
-                            if not is_valid_text:
-                                rule_text_valid = False
-                                current_text_errors.append(
-                                    f"Invalid Text: '{text_content}' ({err_msg})"
-                                )
-                            current_rule_texts.append(text_content)
-
-                    if rule_type_valid and rule_geometry_valid and rule_text_valid:
-                        # Re-verify color for this specific rule
-                        this_rule_color_valid = False
-                        if required_color in ["Any", "NA", "N/A", "ANY"]:
-                            this_rule_color_valid = True
-                        elif required_color in [
-                            "As per Sub-Occupancy",
-                            "As per sub-occupancy type",
-                        ]:
-                            if layer.dxf.color in occupancy_colors:
-                                this_rule_color_valid = True
-                            if (
-                                layer.dxf.hasattr("true_color")
-                                and layer.dxf.true_color in occupancy_colors
-                            ):
-                                this_rule_color_valid = True
-                        else:
-                            # For simplification, relying on earlier color check for candidate selection
-                            pass
-
-                        if valid_match_found:
-                            fully_compliant_rule_found = True
-
-                            # Store Data for Display (Area / Text) if this rule matched
-                            if required_type == "Polygon" and current_rule_area > 0:
-                                total_layer_area = current_rule_area
-                            if required_type == "Text" and current_rule_texts:
-                                text_values = current_rule_texts
-
-                    if not rule_type_valid:
-                        type_errors.extend(current_type_errors)
-                    if not rule_geometry_valid:
-                        geometry_errors.extend(current_geometry_errors)
-                    if not rule_text_valid:
-                        current_text_errors = list(set(current_text_errors))  # Dedup
-                        # Add to messages directly here or later?
-                        # Let's collect them
-                        type_errors.extend(
-                            current_text_errors
-                        )  # Treat text content errors as type/data errors
-
-                # Summarize findings
-                # If we had a color match, but Type/Geometry failed for ALL matching rules -> Error
-                if valid_match_found:
-                    if not fully_compliant_rule_found:
-                        # Report errors from the first matching rule (or unique errors) to avoid spam
-                        if type_errors:
-                            final_layer_status = "error"
-                            layer_info["messages"].extend(
-                                sorted(list(set(type_errors)))[:3]
-                            )  # Limit msgs
-                        if geometry_errors:
-                            final_layer_status = "error"
-                            layer_info["messages"].extend(
-                                sorted(list(set(geometry_errors)))[:3]
-                            )
-                    else:
-                        # Valid Layer - Add Data Info
-                        if total_layer_area > 0:
-                            layer_data.append(f"Area: {total_layer_area:.2f} sq.m")
-
-                        if text_values:
-                            # Single Value Constraint Check
-                            unique_texts = sorted(list(set(text_values)))
-                            if is_single_value_layer and len(unique_texts) > 1:
-                                final_layer_status = "error"
-                                layer_info["messages"].append(
-                                    f"Multiple values found for Voltage: {', '.join(unique_texts)}. Expected single unique value."
-                                )
-                            else:
-                                layer_data.append(
-                                    f"Text: {', '.join(unique_texts[:3])}"
-                                    + ("..." if len(unique_texts) > 3 else "")
-                                )
-
-            layer_info["status"] = final_layer_status
-            layer_info["data_attributes"] = layer_data  # New field for UI
-
-            # Check if layer color matches any of the rules
-            for rule in matched_rules:
-                required_color = rule["Color Code"]
-                required_type = rule["Type"]
-                allowed_colors.append(required_color)
-                allowed_types.append(required_type)
-
-                # Check Layer Color
-                if required_color in [
-                    "As per Sub-Occupancy",
-                    "As per sub-occupancy type",
-                ]:
-                    if layer.dxf.color in occupancy_colors:
-                        valid_match_found = True
-                    # Check True Color
-                    if (
-                        layer.dxf.hasattr("true_color")
-                        and layer.dxf.true_color in occupancy_colors
-                    ):
-                        valid_match_found = True
-                elif required_color.startswith("RGB"):
-                    try:
-                        parts = [
-                            int(x.strip())
-                            for x in required_color.replace("RGB", "").split(",")
-                        ]
-                        if len(parts) == 3:
-                            expected_int = colors.rgb2int(
-                                (parts[0], parts[1], parts[2])
-                            )
-                            if (
-                                layer.dxf.hasattr("true_color")
-                                and layer.dxf.true_color == expected_int
-                            ):
-                                valid_match_found = True
-                    except:
-                        pass
-                elif required_color in ["Any", "NA", "N/A", "ANY"]:
-                    valid_match_found = True
-                else:
-                    # Handle complex color codes like "1, 2, 3", "1 (M)"
-                    try:
-                        allowed_list = []
-                        for part in str(required_color).split(","):
-                            match = re.search(r"(\d+)", part)
-                            if match:
-                                allowed_list.append(int(match.group(1)))
-
-                        if layer.dxf.color in allowed_list:
-                            valid_match_found = True
-                    except:
-                        pass
-
-                if valid_match_found:
-                    break
-
-            # If layer color is invalid, check if all entities have valid explicit colors
-            if not valid_match_found and layer_info["status"] == "error":
-                # Build set of allowed color codes for validation
-                allowed_code_set = set()
-                for c in allowed_colors:
-                    if c in ["As per Sub-Occupancy", "As per sub-occupancy type"]:
-                        allowed_code_set.update(occupancy_colors)
-                    elif c.startswith("RGB"):
-                        try:
-                            parts = [
-                                int(x.strip()) for x in c.replace("RGB", "").split(",")
-                            ]
-                            if len(parts) == 3:
-                                expected_int = colors.rgb2int(
-                                    (parts[0], parts[1], parts[2])
-                                )
-                                allowed_code_set.add(expected_int)
-                        except:
-                            pass
-                    elif c in ["Any", "NA", "N/A", "ANY"]:
-                        allowed_code_set.add("Any")
-                    else:
-                        # Handle complex color codes like "1, 2, 3", "1 (M)"
-                        try:
-                            for part in str(c).split(","):
-                                match = re.search(r"(\d+)", part)
-                                if match:
-                                    allowed_code_set.add(int(match.group(1)))
-                        except:
-                            pass
-
-                # Check entities
-                msp = doc.modelspace()
-                layer_entities = msp.query(f'*[layer=="{name}"]')
-
-                if len(layer_entities) > 0:
-                    all_entities_valid = True
-                    for e in layer_entities:
-                        e_color = e.dxf.color
-                        e_true_color = (
-                            e.dxf.true_color if e.dxf.hasattr("true_color") else None
-                        )
-
-                        entity_valid = False
-
-                        # ByLayer (256) inherits invalid layer color
-                        if e_color == 256:
-                            entity_valid = False
-                        # ByBlock (0) is not acceptable
-                        elif e_color == 0:
-                            entity_valid = False
-                        elif "Any" in allowed_code_set:
-                            entity_valid = True
-                        else:
-                            if e_color in allowed_code_set:
-                                entity_valid = True
-                            elif (
-                                e_true_color is not None
-                                and e_true_color in allowed_code_set
-                            ):
-                                entity_valid = True
-
-                        if not entity_valid:
-                            all_entities_valid = False
-                            break
-
-                    if all_entities_valid:
-                        # Accept layer if all entities have valid explicit colors
-                        layer_info["status"] = "valid"
-                        valid_match_found = True
-
-            if not valid_match_found:
-                layer_info["status"] = "error"
-                # Get unique allowed colors for error message
-                unique_colors = sorted(list(set(allowed_colors)))
-
-                # Expand "As per Sub-Occupancy" for better error message
-                expanded_colors = []
-                fix_color_code = None
-
-                for c in unique_colors:
-                    if c in ["As per Sub-Occupancy", "As per sub-occupancy type"]:
-                        if not occupancy_colors:
-                            expanded_colors.append(
-                                "As per Sub-Occupancy (No valid BLT_UP_AREA layers found to define colors)"
-                            )
-                        else:
-                            occ_list = sorted([str(oc) for oc in occupancy_colors])
-                            expanded_colors.append(
-                                f"As per Sub-Occupancy ({', '.join(occ_list)})"
-                            )
-                    else:
-                        expanded_colors.append(c)
-                        # Pick first valid color as fix target if not yet set
-                        if not fix_color_code and c not in ["Any", "NA", "N/A", "ANY"]:
-                            if str(c).startswith("RGB"):
-                                fix_color_code = (
-                                    f"T {str(c).replace('RGB', '').strip()}"
-                                )
-                            else:
-                                try:
-                                    parts = str(c).split(",")
-                                    match = re.search(r"(\d+)", parts[0])
-                                    if match:
-                                        fix_color_code = match.group(1)
-                                except:
-                                    pass
-
-                msg = f"Incorrect color. Expected one of: {', '.join(expanded_colors)}, Found: {layer.dxf.color}"
-                if layer.dxf.hasattr("true_color"):
-                    msg += f" (True Color {layer.dxf.true_color})"
-                layer_info["messages"].append(msg)
-                errors.append(f"Layer '{name}': {msg}")
-
-                if fix_color_code:
-                    fix_actions.append(
-                        {"type": "fix_color", "layer": name, "color": fix_color_code}
-                    )
-
+    for name, rule_indices, layer_color, layer_true_color in pending_layers:
+        layer_info = _validate_layer(
+            name,
+            [master_rules[i] for i in rule_indices],
+            layer_color,
+            layer_true_color,
+            entities_by_layer.get(name, ()),
+            occupancy_colors,
+            errors,
+            warnings,
+            fix_actions,
+            error_markers,
+        )
         validated_layers.append(layer_info)
 
-    # Generate Preview SVG if errors found (or always?)
-    # Generating always is nice for "Preview", but might be slow.
-    # Let's generate it.
+    # Rendering the preview is the slowest step, so callers that only need
+    # pass/fail skip it.
     # Note: config_path is passed from the caller (upload_file route)
-    preview_svg = generate_preview_svg(doc, error_markers, config_path)
+    preview_svg = None
+    if include_preview:
+        preview_svg = generate_preview_svg(
+            doc, error_markers, config_path, entities_by_layer=entities_by_layer
+        )
 
     # Generate layer analysis data for the table
-    layer_analysis = get_layer_analysis_data(doc)
+    layer_analysis = get_layer_analysis_data(doc) if include_analysis else None
 
     return {
         "success": True,
@@ -1497,19 +1724,47 @@ def validate_dxf_content(doc, master_rules, config_path=None):
     }
 
 
+def hash_file(path):
+    """SHA-256 hex digest of a file, streamed instead of read into memory"""
+    with open(path, "rb") as f:
+        return hashlib.file_digest(f, "sha256").hexdigest()
+
+
+def save_upload(file, path, chunk_size=1 << 20):
+    """
+    Save an uploaded FileStorage to path, hashing it on the way.
+    Returns (SHA-256 hex digest, size in bytes) so the file is never re-read.
+    """
+    digest = hashlib.sha256()
+    size = 0
+    with open(path, "wb") as out:
+        for chunk in iter(lambda: file.stream.read(chunk_size), b""):
+            digest.update(chunk)
+            out.write(chunk)
+            size += len(chunk)
+    return digest.hexdigest(), size
+
+
 def store_version_metadata(
-    doc, filename, original_filename, filepath, project_name=None
+    doc,
+    filename,
+    original_filename,
+    filepath,
+    project_name=None,
+    file_hash=None,
+    file_size=None,
+    entities_by_layer=None,
 ):
     """
     Store version metadata and layer snapshots in database.
-    Called after successful DXF validation.
+    Called after successful DXF validation. file_hash / file_size may be
+    passed in when already known (e.g. from save_upload) to skip re-reading,
+    and entities_by_layer when an index_entities_by_layer() result exists.
     """
     try:
         # Calculate file hash
-        import hashlib
-
-        with open(filepath, "rb") as f:
-            file_hash = hashlib.sha256(f.read()).hexdigest()
+        if file_hash is None:
+            file_hash = hash_file(filepath)
 
         # Check if version already exists
         existing = Version.query.filter_by(file_hash=file_hash).first()
@@ -1517,7 +1772,8 @@ def store_version_metadata(
             return existing.id
 
         # Get file size
-        file_size = os.path.getsize(filepath)
+        if file_size is None:
+            file_size = os.path.getsize(filepath)
 
         # Create version record with user association
         version = Version(
@@ -1534,65 +1790,82 @@ def store_version_metadata(
         db.session.add(version)
         db.session.flush()  # Get version.id
 
-        # Create layer snapshots
+        # One pass over modelspace instead of an entity query per layer
+        if entities_by_layer is None:
+            entities_by_layer = index_entities_by_layer(doc.modelspace())
+
+        # Layer snapshot rows as plain dicts, inserted in one executemany below
+        snapshot_rows = []
+        # Per-layer bbox corners, reduced into the version's drawing bbox
+        layer_mins = []
+        layer_maxs = []
         for layer in doc.layers:
             layer_name = layer.dxf.name
 
             # Extract metrics
-            msp = doc.modelspace()
-            entities = msp.query(f'*[layer=="{layer_name}"]')
+            entities = entities_by_layer.get(layer_name, ())
 
-            # Calculate area for closed polygons
+            # One pass over the layer's entities collects closed polygons for
+            # the area and records each entity's center for the bbox
             total_area = 0.0
-            for entity in entities:
+            # x/y views of closed LWPOLYLINE vertices, areas summed in one batch
+            closed_xys = []
+            # (n, 2) centers, reduced in C instead of x/y lists and min/max
+            centers = np.empty((len(entities), 2))
+            for i, entity in enumerate(entities):
                 dxftype = entity.dxftype()
-                if (
-                    dxftype == "LWPOLYLINE"
-                    and hasattr(entity, "is_closed")
-                    and entity.is_closed
-                ):
-                    try:
-                        points = list(entity.points())
-                        if len(points) >= 3:
-                            area = abs(calculate_entity_area(entity))
-                            total_area += area
-                    except:
-                        pass
+                if dxftype == "LWPOLYLINE" and entity.is_closed:
+                    # polygon_areas treats < 3 vertices as 0
+                    closed_xys.append(entity.lwpoints.values[:, :2])
                 elif dxftype == "HATCH" and hasattr(entity, "area"):
                     total_area += entity.area
 
+                # get_entity_center returns (0, 0) for types it cannot place,
+                # so those skip the call
+                if dxftype in _CENTER_TYPES:
+                    center = get_entity_center(entity)
+                    centers[i] = center[0], center[1]
+                else:
+                    centers[i] = 0.0, 0.0
+
+            if closed_xys:
+                total_area += float(polygon_areas(closed_xys).sum())
+
             # Get bounding box
             min_x, min_y, max_x, max_y = None, None, None, None
             if len(entities) > 0:
-                all_x, all_y = [], []
-                for entity in entities:
-                    try:
-                        center = get_entity_center(entity)
-                        all_x.append(center[0])
-                        all_y.append(center[1])
-                    except:
-                        pass
-                if all_x and all_y:
-                    min_x, max_x = min(all_x), max(all_x)
-                    min_y, max_y = min(all_y), max(all_y)
-
-            snapshot = LayerSnapshot(
-                version_id=version.id,
-                layer_name=layer_name,
-                entity_count=len(entities),
-                total_area=total_area,
-                min_x=min_x,
-                min_y=min_y,
-                max_x=max_x,
-                max_y=max_y,
-                color=layer.dxf.color if hasattr(layer.dxf, "color") else None,
-                linetype=layer.dxf.linetype
-                if hasattr(layer.dxf, "linetype")
-                else "Continuous",
-                is_visible=not layer.is_off(),
+                min_x, min_y = centers.min(axis=0).tolist()
+                max_x, max_y = centers.max(axis=0).tolist()
+                layer_mins.append((min_x, min_y))
+                layer_maxs.append((max_x, max_y))
+
+            snapshot_rows.append(
+                dict(
+                    version_id=version.id,
+                    layer_name=layer_name,
+                    entity_count=len(entities),
+                    total_area=total_area,
+                    min_x=min_x,
+                    min_y=min_y,
+                    max_x=max_x,
+                    max_y=max_y,
+                    color=layer.dxf.color if hasattr(layer.dxf, "color") else None,
+                    linetype=(
+                        layer.dxf.linetype
+                        if hasattr(layer.dxf, "linetype")
+                        else "Continuous"
+                    ),
+                    is_visible=not layer.is_off(),
+                )
             )
-            db.session.add(snapshot)
 
+        if snapshot_rows:
+            db.session.execute(insert(LayerSnapshot), snapshot_rows)
+
+        version.total_area = sum(row["total_area"] for row in snapshot_rows)
+        if layer_mins:
+            version.min_x, version.min_y = np.min(layer_mins, axis=0).tolist()
+            version.max_x, version.max_y = np.max(layer_maxs, axis=0).tolist()
         db.session.commit()
         return version.id
 
@@ -1607,18 +1880,230 @@ def store_version_metadata(
 # ============================================================================
 
 
-@app.route("/versions", methods=["GET"])
-@login_required
-def list_versions():
-    """List user's stored versions with filtering by project"""
-    project = request.args.get("project", None)
+# Comparator input per version, most recently used last. A version's snapshots
+# never change after upload, so entries stay valid until the version is deleted.
+SNAPSHOT_CACHE_SIZE = 64
+_SNAPSHOT_CACHE = OrderedDict()
+# gunicorn runs threaded workers, and OrderedDict reordering is not atomic
+_SNAPSHOT_CACHE_LOCK = threading.Lock()
+
+
+# Columns the comparator reads; geometry_hash and the row id are never needed
+_SNAPSHOT_METRIC_COLUMNS = (
+    "entity_count",
+    "total_area",
+    "perimeter",
+    "min_x",
+    "min_y",
+    "max_x",
+    "max_y",
+    "color",
+    "linetype",
+    "is_visible",
+)
+
+
+def load_snapshots_grouped(versions):
+    """
+    Load the comparator metrics for several versions, returning
+    {version_id: {layer_name: metrics_dict}}. Versions already in the cache are
+    served from it; the rest are fetched together in one IN query. The cache key
+    includes the upload date so a reused id (e.g. after a delete in another
+    worker) never hits a stale entry.
+    """
+    grouped = {}
+    missing = {}
+    with _SNAPSHOT_CACHE_LOCK:
+        for version in versions:
+            key = (version.id, version.upload_date)
+            data = _SNAPSHOT_CACHE.get(key)
+            if data is not None:
+                _SNAPSHOT_CACHE.move_to_end(key)
+                grouped[version.id] = data
+            else:
+                missing[version.id] = key
+                grouped[version.id] = {}
+
+    if missing:
+        snapshots = (
+            LayerSnapshot.query.filter(LayerSnapshot.version_id.in_(list(missing)))
+            .options(
+                load_only(
+                    LayerSnapshot.version_id,
+                    LayerSnapshot.layer_name,
+                    *(getattr(LayerSnapshot, c) for c in _SNAPSHOT_METRIC_COLUMNS),
+                )
+            )
+            .all()
+        )
+        for s in snapshots:
+            grouped[s.version_id][s.layer_name] = {
+                c: getattr(s, c) for c in _SNAPSHOT_METRIC_COLUMNS
+            }
+
+        with _SNAPSHOT_CACHE_LOCK:
+            for version_id, key in missing.items():
+                _SNAPSHOT_CACHE[key] = grouped[version_id]
+            while len(_SNAPSHOT_CACHE) > SNAPSHOT_CACHE_SIZE:
+                _SNAPSHOT_CACHE.popitem(last=False)
+
+    return grouped
+
+
+def evict_snapshot_cache(version_id):
+    """Drop cached snapshot data for a version (e.g. when it is deleted)"""
+    with _SNAPSHOT_CACHE_LOCK:
+        for key in [key for key in _SNAPSHOT_CACHE if key[0] == version_id]:
+            del _SNAPSHOT_CACHE[key]
+
+
+def encode_changes(changes):
+    """Serialize a comparison's change list for ComparisonResult.changes_json"""
+    return base64.b64encode(zlib.compress(orjson.dumps(changes), 6)).decode("ascii")
+
+
+def decode_changes(raw):
+    """Inverse of encode_changes, also reading uncompressed legacy rows"""
+    if isinstance(raw, bytes):
+        # Raw zlib output that SQLite kept while the column was binary
+        return orjson.loads(zlib.decompress(raw))
+    if raw.lstrip().startswith(("[", "{")):
+        return orjson.loads(raw)
+    return orjson.loads(zlib.decompress(base64.b64decode(raw)))
+
+
+# Rendered comparison pages keyed by comparison_etag() (version ids, user and
+# both upload dates), most recently used last: (expiry, version ids, context)
+COMPARE_CACHE_TTL = 60
+COMPARE_CACHE_SIZE = 64
+_COMPARE_CACHE = OrderedDict()
+_COMPARE_CACHE_LOCK = threading.Lock()
+
+
+def get_cached_comparison(etag):
+    """Template context cached under etag, or None if absent or expired"""
+    with _COMPARE_CACHE_LOCK:
+        entry = _COMPARE_CACHE.get(etag)
+        if entry is None:
+            return None
+        if entry[0] <= time.monotonic():
+            del _COMPARE_CACHE[etag]
+            return None
+        _COMPARE_CACHE.move_to_end(etag)
+        return entry[2]
+
+
+def cache_compare_result(etag, base_version, new_version, changes, summary):
+    """Keep a comparison's template context for COMPARE_CACHE_TTL seconds"""
+
+    # Plain copies of the fields the template shows; ORM rows would be detached
+    # (and expired) by the time a later request renders them
+    def version_view(version):
+        return SimpleNamespace(
+            id=version.id,
+            original_filename=version.original_filename,
+            upload_date=version.upload_date,
+            total_layers=version.total_layers,
+        )
+
+    context = dict(
+        base_version=version_view(base_version),
+        new_version=version_view(new_version),
+        changes=changes,
+        summary=summary,
+        diff_svg=None,
+    )
+    now = time.monotonic()
+    with _COMPARE_CACHE_LOCK:
+        # Drop expired entries, then the least recently used beyond the cap
+        for stale, (expires, _, _) in list(_COMPARE_CACHE.items()):
+            if expires <= now:
+                del _COMPARE_CACHE[stale]
+        _COMPARE_CACHE[etag] = (
+            now + COMPARE_CACHE_TTL,
+            (base_version.id, new_version.id),
+            context,
+        )
+        _COMPARE_CACHE.move_to_end(etag)
+        while len(_COMPARE_CACHE) > COMPARE_CACHE_SIZE:
+            _COMPARE_CACHE.popitem(last=False)
+
+
+def evict_compare_cache(version_id):
+    """
+    Drop cached comparison pages that involve a version. Other workers never
+    serve theirs either: the version's etag lookup fails once it is deleted.
+    """
+    with _COMPARE_CACHE_LOCK:
+        for key, (_, version_ids, _) in list(_COMPARE_CACHE.items()):
+            if version_id in version_ids:
+                del _COMPARE_CACHE[key]
+
+
+def comparison_etag(base_id, new_id):
+    """
+    Weak ETag for a comparison page, or None unless the current user owns both
+    versions. Results never change for a pair of uploads, so the versions'
+    upload dates (which change if an id is reused) are all it needs.
+    """
+    upload_dates = dict(
+        db.session.query(Version.id, Version.upload_date)
+        .filter(Version.id.in_((base_id, new_id)), Version.user_id == current_user.id)
+        .all()
+    )
+    if base_id not in upload_dates or new_id not in upload_dates:
+        return None
+    return (
+        f"cmp-{base_id}-{new_id}-u{current_user.id}-"
+        f"{upload_dates[base_id]:%Y%m%d%H%M%S}-{upload_dates[new_id]:%Y%m%d%H%M%S}"
+    )
+
+
+def render_comparison(etag, context):
+    """
+    Render a comparison page. Pages without flashed messages carry the ETag and
+    are revalidated on each visit (no-cache), so deleting a version still shows.
+    """
+    response = make_response(render_template("comparison_result.html", **context))
+    if etag is not None and not get_flashed_messages():
+        response.set_etag(etag, weak=True)
+        response.headers["Cache-Control"] = "private, no-cache"
+    return response
+
 
-    # Filter versions by current user
+def list_user_versions(project=None):
+    """
+    Current user's versions, newest first. The listing pages only render
+    per-row columns (total_layers is stored at upload time rather than counted
+    from snapshots), so a single query covers the page; load_only skips the
+    notes and hash columns they never show.
+    """
     query = Version.query.filter_by(user_id=current_user.id)
     if project:
         query = query.filter_by(project_name=project)
 
-    versions = query.order_by(Version.upload_date.desc()).all()
+    return (
+        query.options(
+            load_only(
+                Version.original_filename,
+                Version.upload_date,
+                Version.file_size,
+                Version.dxf_version,
+                Version.total_layers,
+                Version.project_name,
+            )
+        )
+        .order_by(Version.upload_date.desc())
+        .all()
+    )
+
+
+@app.route("/versions", methods=["GET"])
+@login_required
+def list_versions():
+    """List user's stored versions with filtering by project"""
+    project = request.args.get("project", None)
+    versions = list_user_versions(project)
 
     # Get unique project names for filter dropdown (user's projects only)
     projects = (
@@ -1656,11 +2141,7 @@ def compare_versions():
 
     # GET request - show version selection form (user's versions only)
     project = request.args.get("project", None)
-    query = Version.query.filter_by(user_id=current_user.id)
-    if project:
-        query = query.filter_by(project_name=project)
-
-    versions = query.order_by(Version.upload_date.desc()).all()
+    versions = list_user_versions(project)
     projects = (
         db.session.query(Version.project_name)
         .filter_by(user_id=current_user.id)
@@ -1681,6 +2162,27 @@ def compare_versions():
 @login_required
 def comparison_result(base_id, new_id):
     """Display comparison results between two versions"""
+    # A browser revalidating a page it already has gets a 304 after one small
+    # query, without loading snapshots or rendering. Pending flash messages
+    # need a full render, or they would surface later on an unrelated page.
+    etag = comparison_etag(base_id, new_id)
+    if (
+        etag is not None
+        and not session.get("_flashes")
+        and request.if_none_match.contains_weak(etag)
+    ):
+        response = make_response("", 304)
+        response.set_etag(etag, weak=True)
+        return response
+
+    # Repeat views within the TTL skip the version and result queries. The
+    # cache is keyed on the etag, which only exists while the user owns both
+    # versions and changes if an id is reused, so deletes in any worker apply.
+    if etag is not None:
+        cached = get_cached_comparison(etag)
+        if cached is not None:
+            return render_comparison(etag, cached)
+
     base_version = Version.query.get_or_404(base_id)
     new_version = Version.query.get_or_404(new_id)
 
@@ -1699,7 +2201,7 @@ def comparison_result(base_id, new_id):
 
     if existing:
         # Use cached results
-        changes = json.loads(existing.changes_json)
+        changes = decode_changes(existing.changes_json)
         summary = {
             "total_layers_base": base_version.total_layers,
             "total_layers_new": new_version.total_layers,
@@ -1709,31 +2211,14 @@ def comparison_result(base_id, new_id):
             "unchanged_count": existing.unchanged_layers_count,
         }
         diff_svg = None  # Diff SVG not stored, would need to regenerate
+        if etag is not None:
+            cache_compare_result(etag, base_version, new_version, changes, summary)
     else:
         # Perform comparison using stored LayerSnapshots
 
-        # Helper to convert snapshots to metrics dict format expected by comparator
-        def snapshots_to_dict(version_id):
-            snapshots = LayerSnapshot.query.filter_by(version_id=version_id).all()
-            data = {}
-            for s in snapshots:
-                data[s.layer_name] = {
-                    "entity_count": s.entity_count,
-                    "total_area": s.total_area,
-                    "perimeter": s.perimeter,
-                    "min_x": s.min_x,
-                    "min_y": s.min_y,
-                    "max_x": s.max_x,
-                    "max_y": s.max_y,
-                    "color": s.color,
-                    "linetype": s.linetype,
-                    "is_visible": s.is_visible,
-                }
-            return data
-
         try:
-            base_data = snapshots_to_dict(base_id)
-            new_data = snapshots_to_dict(new_id)
+            grouped = load_snapshots_grouped([base_version, new_version])
+            base_data, new_data = grouped[base_id], grouped[new_id]
 
             comparator = DXFComparator()
             changes_objects, summary_obj = comparator.compare_snapshot_data(
@@ -1752,7 +2237,7 @@ def comparison_result(base_id, new_id):
                 removed_layers_count=summary["removed_count"],
                 modified_layers_count=summary["modified_count"],
                 unchanged_layers_count=summary["unchanged_count"],
-                changes_json=json.dumps(changes),
+                changes_json=encode_changes(changes),
             )
             db.session.add(result)
             db.session.commit()
@@ -1760,6 +2245,8 @@ def comparison_result(base_id, new_id):
             diff_svg = (
                 None  # SVG generation requires original DXF files which are not stored
             )
+            if etag is not None:
+                cache_compare_result(etag, base_version, new_version, changes, summary)
 
         except Exception as e:
             db.session.rollback()
@@ -1778,13 +2265,15 @@ def comparison_result(base_id, new_id):
             }
             diff_svg = None
 
-    return render_template(
-        "comparison_result.html",
-        base_version=base_version,
-        new_version=new_version,
-        changes=changes,
-        summary=summary,
-        diff_svg=diff_svg,
+    return render_comparison(
+        etag,
+        dict(
+            base_version=base_version,
+            new_version=new_version,
+            changes=changes,
+            summary=summary,
+            diff_svg=diff_svg,
+        ),
     )
 
 
@@ -1802,6 +2291,8 @@ def delete_version(version_id):
     try:
         db.session.delete(version)
         db.session.commit()
+        evict_snapshot_cache(version_id)
+        evict_compare_cache(version_id)
         flash(f"Version '{version.original_filename}' deleted successfully", "success")
     except Exception as e:
         db.session.rollback()
@@ -1879,6 +2370,9 @@ def login():
         user = User.query.filter_by(username=username).first()
 
         if user and user.check_password(password):
+            if user.password_needs_rehash():
+                user.set_password(password)
+                db.session.commit()
             login_user(user, remember=remember)
             next_page = request.args.get("next")
             flash(f"Welcome back, {user.username}!", "success")
@@ -1927,8 +2421,8 @@ def admin():
         if file and file.filename and file.filename.endswith(".json"):
             try:
                 # Verify valid JSON before saving
-                content = json.load(file.stream)
-                # Save to disk
+                content = orjson.loads(file.stream.read())
+                # Save to disk (stdlib json keeps the 4-space indent for hand edits)
                 with open(app.config["MASTER_JSON"], "w") as f:
                     json.dump(content, f, indent=4)
                 flash("Master data updated successfully", "success")
@@ -1958,40 +2452,30 @@ def upload_file():
         return redirect(url_for("index"))
 
     filepath = None
-    extract_dir = None
 
     try:
         filename = secure_filename(file.filename)
         if not filename:
             raise Exception("Invalid filename")
 
-        filepath = os.path.join(app.config["UPLOAD_FOLDER"], filename)
-        file.save(filepath)
-
-        target_dxf = filepath
+        # Concurrent uploads of the same name each get their own file
+        fd, filepath = tempfile.mkstemp(
+            dir=app.config["UPLOAD_FOLDER"], suffix=os.path.splitext(filename)[1]
+        )
+        os.close(fd)
+        upload_hash, upload_size = save_upload(file, filepath)
 
-        # Extract DXF from ZIP if necessary
+        # For a ZIP, find the first DXF member; it is read straight from the
+        # archive, so the rest of the project files are never extracted
+        dxf_member = None
         if filename.lower().endswith(".zip"):
-            extract_dir = os.path.join(
-                app.config["UPLOAD_FOLDER"], f"temp_{os.path.splitext(filename)[0]}"
-            )
-            os.makedirs(extract_dir, exist_ok=True)
-
             with zipfile.ZipFile(filepath, "r") as zip_ref:
-                zip_ref.extractall(extract_dir)
-
-            # Find first DXF in extracted files
-            found_dxf = False
-            for root, dirs, files in os.walk(extract_dir):
-                for f in files:
-                    if f.lower().endswith(".dxf"):
-                        target_dxf = os.path.join(root, f)
-                        found_dxf = True
-                        break
-                if found_dxf:
-                    break
-
-            if not found_dxf:
+                dxf_member = next(
+                    (n for n in zip_ref.namelist() if n.lower().endswith(".dxf")),
+                    None,
+                )
+
+            if dxf_member is None:
                 raise Exception("No .dxf file found in the zip archive")
 
         # Load master validation rules based on selection
@@ -2003,8 +2487,7 @@ def upload_file():
         if rules_source == "odisha":
             rules_path = app.config["MASTER_JSON"]
             if os.path.exists(rules_path):
-                with open(rules_path, "r") as f:
-                    master_rules = json.load(f)
+                master_rules = load_rules(rules_path)
             rules_source_name = "Odisha Rules"
             # Use odisha_cadtopdf.json for SVG preview config
             config_path = os.path.join(
@@ -2013,8 +2496,7 @@ def upload_file():
         elif rules_source == "ppa":
             rules_path = os.path.join(os.path.dirname(__file__), "ppa_layers.json")
             if os.path.exists(rules_path):
-                with open(rules_path, "r") as f:
-                    master_rules = json.load(f)
+                master_rules = load_rules(rules_path)
             else:
                 raise Exception("PPA Rules file not found on server")
             rules_source_name = "PPA Rules"
@@ -2032,7 +2514,7 @@ def upload_file():
 
             if cfile and cfile.filename.endswith(".json"):
                 try:
-                    master_rules = json.load(cfile.stream)
+                    master_rules = orjson.loads(cfile.stream.read())
                     rules_source_name = f"Custom Rules ({cfile.filename})"
                 except Exception as e:
                     raise Exception(f"Invalid JSON in custom rules file: {str(e)}")
@@ -2043,8 +2525,23 @@ def upload_file():
 
         # Read and validate DXF file
         try:
-            doc = ezdxf.readfile(target_dxf)
-            result = validate_dxf_content(doc, master_rules, config_path)
+            # Validation (closure, areas, text content), the SVG preview and the
+            # snapshots all read entity geometry, so iterdxf streaming cannot
+            # replace the full document; it is loaded once and shared instead.
+            if dxf_member is None:
+                doc = ezdxf.readfile(filepath)
+            else:
+                doc = ezdxf.readzip(filepath, dxf_member)
+            # Validation and snapshot storage share one modelspace pass
+            entities_by_layer = index_entities_by_layer(doc.modelspace())
+            result = validate_dxf_content(
+                doc,
+                master_rules,
+                config_path,
+                include_preview=True,
+                include_analysis=True,
+                entities_by_layer=entities_by_layer,
+            )
             result["filename"] = filename
             result["rules_source_name"] = rules_source_name
 
@@ -2057,6 +2554,9 @@ def upload_file():
                         original_filename=file.filename,
                         filepath=filepath,
                         project_name=request.form.get("project_name", None),
+                        file_hash=upload_hash,
+                        file_size=upload_size,
+                        entities_by_layer=entities_by_layer,
                     )
                     if version_id:
                         result["version_id"] = version_id
@@ -2068,24 +2568,62 @@ def upload_file():
         except Exception as e:
             raise Exception(f"Error parsing DXF: {str(e)}")
 
-        # Clean up temporary files
-        if filepath and os.path.exists(filepath):
-            os.remove(filepath)
-        if extract_dir and os.path.exists(extract_dir):
-            shutil.rmtree(extract_dir)
-
         return render_template("results.html", **result)
 
     except Exception as e:
-        # Clean up on error
-        if filepath and os.path.exists(filepath):
-            os.remove(filepath)
-        if extract_dir and os.path.exists(extract_dir):
-            shutil.rmtree(extract_dir)
-
         flash(f"Error processing file: {str(e)}", "error")
         return redirect(url_for("index"))
 
+    finally:
+        # Clean up the saved upload on success and error alike
+        if filepath:
+            with suppress(FileNotFoundError):
+                os.remove(filepath)
+
+
+def _emit_lsp(actions):
+    """Yield the lines of the AutoLISP FixLayers script for the given fix actions"""
+    yield ";; Auto-Generated Fix Script by DXF Validator"
+    yield ";; Run this script in AutoCAD (Drag & Drop or APPLOAD)"
+    yield ""
+    yield "(defun c:FixLayers ()"
+    yield '  (setvar "CMDECHO" 0)'
+    yield '  (command "-LAYER"'
+
+    for action in actions:
+        layer = action.get("layer")
+        color = action.get("color")
+
+        if not layer or not color:
+            continue
+
+        # Handle True Color logic for LISP (simplified, mostly supports Index)
+        # AutoCAD LISP for True Color is complex "c" "t" "r,g,b"
+        if str(color).startswith("T "):
+            # True Color format: "T 255,0,0"
+            rgb = color.replace("T ", "").strip()
+            color_cmd = f'"C" "T" "{rgb}" "{layer}"'
+        else:
+            # Index Color
+            color_cmd = f'"C" "{color}" "{layer}"'
+
+        if action["type"] == "create_layer":
+            # Make (Create) layer and set color
+            # "M" makes and sets current. "N" New.
+            # Better: "N" to create, then "C" to set color.
+            yield f'    "N" "{layer}"'
+            yield f"    {color_cmd}"
+        elif action["type"] == "fix_color":
+            yield f"    {color_cmd}"
+
+    yield '    "")'  # End Layer command
+    yield '  (setvar "CMDECHO" 1)'
+    yield '  (princ "\\nLayers Updated Successfully.")'
+    yield "  (princ)"
+    yield ")"
+    yield ""
+    yield '(princ "\\nType FixLayers to run the script.")'
+
 
 @app.route("/generate_fix_script", methods=["POST"])
 @login_required
@@ -2097,60 +2635,14 @@ def generate_fix_script():
             return "No actions provided", 400
 
         actions = data["actions"]
-        lsp_content = [
-            ";; Auto-Generated Fix Script by DXF Validator",
-            ";; Run this script in AutoCAD (Drag & Drop or APPLOAD)",
-            "",
-            "(defun c:FixLayers ()",
-            '  (setvar "CMDECHO" 0)',
-            '  (command "-LAYER"',
-        ]
-
-        for action in actions:
-            layer = action.get("layer")
-            color = action.get("color")
 
-            if not layer or not color:
-                continue
-
-            # Handle True Color logic for LISP (simplified, mostly supports Index)
-            # AutoCAD LISP for True Color is complex "c" "t" "r,g,b"
-            color_cmd = ""
-            if str(color).startswith("T "):
-                # True Color format: "T 255,0,0"
-                rgb = color.replace("T ", "").strip()
-                color_cmd = f'"C" "T" "{rgb}" "{layer}"'
-            else:
-                # Index Color
-                color_cmd = f'"C" "{color}" "{layer}"'
-
-            if action["type"] == "create_layer":
-                # Make (Create) layer and set color
-                # "M" makes and sets current. "N" New.
-                # Better: "N" to create, then "C" to set color.
-                lsp_content.append(f'    "N" "{layer}"')
-                lsp_content.append(f"    {color_cmd}")
-            elif action["type"] == "fix_color":
-                lsp_content.append(f"    {color_cmd}")
-
-        lsp_content.append('    "")')  # End Layer command
-        lsp_content.append('  (setvar "CMDECHO" 1)')
-        lsp_content.append('  (princ "\\nLayers Updated Successfully.")')
-        lsp_content.append("  (princ)")
-        lsp_content.append(")")
-        lsp_content.append("")
-        lsp_content.append('(princ "\\nType FixLayers to run the script.")')
-
-        # Create memory file
-        proxy = io.BytesIO("\n".join(lsp_content).encode("utf-8"))
-        proxy.seek(0)
-
-        return send_file(
-            proxy,
-            as_attachment=True,
-            download_name="fix_layers.lsp",
-            mimetype="application/x-lisp",
-        )
+        # The script is a few KB at most, so it goes out as one bytes body with
+        # a known length instead of a BytesIO streamed through send_file
+        response = make_response("\n".join(_emit_lsp(actions)).encode("utf-8"))
+        response.mimetype = "application/x-lisp"
+        response.headers["Content-Disposition"] = "attachment; filename=fix_layers.lsp"
+        response.headers["Cache-Control"] = "no-cache"
+        return response
 
     except Exception as e:
         return str(e), 500
@@ -2175,9 +2667,43 @@ def format_change_filter(value):
         return str(value)
 
 
+def ensure_indexes():
+    """Create declared indexes missing from databases created before they existed"""
+    # create_all() only emits indexes together with a new table
+    for model in (Version, LayerSnapshot, ComparisonResult):
+        for index in model.__table__.indexes:
+            index.create(bind=db.engine, checkfirst=True)
+
+
+def ensure_columns():
+    """Add nullable columns missing from databases created before they existed"""
+    # create_all() never alters a table that already exists
+    inspector = sqlalchemy_inspect(db.engine)
+    quote = db.engine.dialect.identifier_preparer.quote
+    for model in (Version, LayerSnapshot, ComparisonResult):
+        table = model.__table__
+        present = {column["name"] for column in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if column.name in present or not column.nullable:
+                continue
+            column_type = column.type.compile(dialect=db.engine.dialect)
+            with db.engine.begin() as conn:
+                conn.execute(
+                    text(
+                        f"ALTER TABLE {quote(table.name)} "
+                        f"ADD COLUMN {quote(column.name)} {column_type}"
+                    )
+                )
+
+
 # Database table creation
 with app.app_context():
     db.create_all()
+    ensure_columns()
+    ensure_indexes()
+    # gunicorn --preload runs this once before forking; workers must not
+    # inherit the pooled connections used for it
+    db.engine.dispose()
 
 
 if __name__ == "__main__":
@@ -69,3 +69,224 @@ class TestEntityTypeMapping:
         for entity_type in common_types:
             if entity_type in mapping:
                 assert isinstance(mapping[entity_type], str)
+
+
+class TestLayerPatternParsing:
+    """Test JSON layer name patterns are converted to the right regex."""
+
+    def test_placeholders_match_numbers(self):
+        """Test 'n' placeholders match (optionally negative) numbers."""
+        import re
+        import app
+
+        pattern = app.parse_layer_pattern("BLK_n_FLR_n_BLT_UP_AREA")
+        assert re.match(pattern, "BLK_1_FLR_-2_BLT_UP_AREA")
+        assert not re.match(pattern, "BLK_A_FLR_2_BLT_UP_AREA")
+
+    def test_words_containing_n_are_literal(self):
+        """Test names without placeholders are matched exactly."""
+        import app
+
+        assert app.parse_layer_pattern("Green Area") == "^Green\\ Area$"
+        assert app.compile_layer_pattern("STAIR_n").match("STAIR_12")
+
+    def test_rule_matcher_returns_every_matching_rule(self):
+        """Test the fused matcher finds all rules, across prefix buckets."""
+        import app
+
+        match_rules = app.get_layer_rule_matcher(
+            ("BLK_n_FLR_n", "ROAD", "BLK_n_FLR_n", "BLK_1_FLR_n", "n_X")
+        )
+        assert match_rules("BLK_1_FLR_2") == [0, 2, 3]
+        assert match_rules("BLK_3_FLR_2") == [0, 2]
+        assert match_rules("ROAD") == [1]
+        assert match_rules("PLOT") == []
+
+    def test_mandatory_rules_are_checked_against_fused_matches(self):
+        """Test a mandatory rule is only reported missing when no layer matched."""
+        import ezdxf
+        import app
+
+        rules = [
+            {
+                "Layer Name": name,
+                "Requirement": requirement,
+                "Color Code": "7",
+                "Type": "Polygon",
+            }
+            for name, requirement in (
+                ("BLK_n_FLR_n_ROOM", "Mandatory"),
+                ("BLK_n_FLR_n_ROOM", "Optional"),
+                ("PLOT BOUNDARY", "Mandatory (M)"),
+            )
+        ]
+        match_rules, mandatory = app.compile_rules(rules)
+        assert mandatory == (0, 2)
+        assert match_rules("BLK_1_FLR_0_ROOM") == [0, 1]
+
+        doc = ezdxf.new("R2010")
+        doc.layers.add("BLK_1_FLR_0_ROOM")
+        result = app.validate_dxf_content(doc, rules)
+        missing = [e for e in result["errors"] if e.startswith("Missing Mandatory")]
+        assert len(missing) == 1 and "PLOT BOUNDARY" in missing[0]
+
+
+class TestEntityIndex:
+    """Test modelspace entities are bucketed by exact layer name."""
+
+    def test_quoted_and_case_variant_layer_names(self):
+        """Test names that broke query strings keep their own entities."""
+        import ezdxf
+        import app
+
+        doc = ezdxf.new("R2010")
+        msp = doc.modelspace()
+        doc.layers.add("O'BRIEN LAYER")
+        doc.layers.add("Wall")
+        msp.add_line((0, 0), (1, 0), dxfattribs={"layer": "O'BRIEN LAYER"})
+        msp.add_line((0, 0), (1, 0), dxfattribs={"layer": "Wall"})
+        msp.add_circle((0, 0), 1, dxfattribs={"layer": "Wall"})
+        msp.add_text("A", dxfattribs={"layer": "WALL"})
+
+        index = app.index_entities_by_layer(msp)
+        assert len(index["O'BRIEN LAYER"]) == 1
+        assert [e.dxftype() for e in index["Wall"]] == ["LINE", "CIRCLE"]
+        assert [e.dxftype() for e in index["WALL"]] == ["TEXT"]
+
+
+class TestColorSpecParsing:
+    """Test rule color codes are parsed into tagged specs."""
+
+    def test_aci_lists_take_first_number_per_part(self):
+        """Test "1, 2 (M)" style codes yield the listed ACI numbers."""
+        import app
+
+        assert app._parse_color_spec("1, 2 (M)") == ("aci", frozenset({1, 2}))
+        assert app._parse_color_spec("ANY") == ("any", None)
+
+    def test_rgb_codes(self):
+        """Test RGB codes become a true color int, or None if malformed."""
+        from ezdxf import colors
+        import app
+
+        assert app._parse_color_spec("RGB 255,0,0") == (
+            "rgb",
+            colors.rgb2int((255, 0, 0)),
+        )
+        assert app._parse_color_spec("RGB 255,0") == ("rgb", None)
+
+    def test_fix_color_targets(self):
+        """Test fix scripts get a true color, the first ACI number, or nothing."""
+        import app
+
+        assert app._fix_color_target("RGB 255,0,0") == "T 255,0,0"
+        assert app._fix_color_target("3 (M), 5") == "3"
+        assert app._fix_color_target("ANY") is None
+        assert app._fix_color_target("As per Sub-Occupancy") is None
+
+
+class TestPolygonAreas:
+    """Test the batched shoelace area helper."""
+
+    def test_matches_single_polygon_area(self):
+        """Test batched areas equal per-polygon areas, degenerate ones included."""
+        import numpy as np
+        import app
+
+        square = np.array([[0.0, 0.0], [2.0, 0.0], [2.0, 2.0], [0.0, 2.0]])
+        triangle = np.array([[0.0, 0.0], [4.0, 0.0], [0.0, 3.0]])
+        segment = np.array([[0.0, 0.0], [1.0, 1.0]])
+
+        areas = app.polygon_areas([square, segment, triangle])
+        assert areas.tolist() == [4.0, 0.0, 6.0]
+        assert areas[2] == app.polygon_area(triangle)
+
+    def test_calculate_entity_area_by_type(self):
+        """Test closed LWPOLYLINE and 2D POLYLINE areas; open ones have none."""
+        import ezdxf
+        import app
+
+        msp = ezdxf.new("R2010").modelspace()
+        square = [(0, 0), (3, 0), (3, 3), (0, 3)]
+        triangle = [(0, 0), (4, 0), (0, 3)]
+
+        assert app.calculate_entity_area(msp.add_lwpolyline(square, close=True)) == 9
+        assert app.calculate_entity_area(msp.add_lwpolyline(square)) == 0
+        segment = msp.add_lwpolyline(square[:2], close=True)
+        assert app.calculate_entity_area(segment) == 0
+        polyline = msp.add_polyline2d(triangle, close=True)
+        assert app.calculate_entity_area(polyline) == 6
+        assert app.calculate_entity_area(msp.add_line((0, 0), (1, 1))) == 0
+
+
+class TestChangesEncoding:
+    """Test stored comparison change lists round-trip."""
+
+    def test_round_trip_and_legacy_text(self):
+        """Test compressed rows decode, as do uncompressed JSON and binary rows."""
+        import zlib
+
+        import app
+
+        changes = [{"layer_name": "WALL", "change_type": "modified"}]
+        encoded = app.encode_changes(changes)
+        assert isinstance(encoded, str)
+        assert app.decode_changes(encoded) == changes
+        assert app.decode_changes(zlib.compress(b'[{"layer_name": "WALL"}]')) == [
+            {"layer_name": "WALL"}
+        ]
+        assert app.decode_changes('[{"layer_name": "WALL"}]') == [
+            {"layer_name": "WALL"}
+        ]
+
+
+class TestFixScript:
+    """Test AutoLISP fix script generation."""
+
+    def test_emits_layer_commands_per_action(self):
+        """Test create/fix actions become -LAYER arguments; incomplete ones skip."""
+        import app
+
+        lines = list(
+            app._emit_lsp(
+                [
+                    {"type": "create_layer", "layer": "WALL", "color": "3"},
+                    {"type": "fix_color", "layer": "ROAD", "color": "T 255,0,0"},
+                    {"type": "fix_color", "layer": "", "color": "1"},
+                ]
+            )
+        )
+        assert '    "N" "WALL"' in lines
+        assert '    "C" "3" "WALL"' in lines
+        assert '    "C" "T" "255,0,0" "ROAD"' in lines
+        assert lines.count('    "")') == 1
+        assert not any('"1"' in line for line in lines)
+
+
+class TestComparisonCache:
+    """Test the in-process comparison page cache."""
+
+    def test_capped_and_evicted_by_version(self, monkeypatch):
+        """Test entries are capped LRU-first and dropped with their versions."""
+        from types import SimpleNamespace
+        import app
+
+        monkeypatch.setattr(app, "_COMPARE_CACHE", type(app._COMPARE_CACHE)())
+        monkeypatch.setattr(app, "COMPARE_CACHE_SIZE", 2)
+
+        def version(version_id):
+            return SimpleNamespace(
+                id=version_id,
+                original_filename="a.dxf",
+                upload_date=None,
+                total_layers=1,
+            )
+
+        for etag, ids in (("e1", (1, 2)), ("e2", (1, 3)), ("e3", (4, 5))):
+            app.cache_compare_result(etag, version(ids[0]), version(ids[1]), [], {})
+
+        assert app.get_cached_comparison("e1") is None
+        assert app.get_cached_comparison("e2")["new_version"].id == 3
+        app.evict_compare_cache(3)
+        assert app.get_cached_comparison("e2") is None
+        assert app.get_cached_comparison("e3") is not None